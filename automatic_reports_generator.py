@@ -4,7 +4,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime, timedelta
 from sqlalchemy import text
-from db import get_engine
+from db.db_connection import get_engine
 import matplotlib.dates as mdates
 from matplotlib.backends.backend_pdf import PdfPages
 import numpy as np
@@ -1,24 +1,113 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+from functools import lru_cache
 import re
 import emoji
+import pandas as pd
 import spacy
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from model_analysis.model_registry import get_pipeline
+
+def get_language_detector():
+    """
+    Détecteur de langue xlm-roberta (papluca/xlm-roberta-base-language-detection), chargé une seule
+    fois par processus au premier appel via le registre de modèles.
+    """
+    return get_pipeline("language_detection")
+
+# Mots-outils fréquents et peu ambigus par langue, utilisés par le filtre rapide
+STOPWORDS = {
+    "fr": {
+        "le", "la", "les", "des", "du", "une", "et", "est", "dans", "pour", "sur", "pas", "que", "qui",
+        "avec", "au", "aux", "ce", "cette", "ces", "sont", "il", "elle", "nous", "vous", "ils", "mais",
+        "ou", "où", "son", "sa", "ses", "leur", "été", "être", "plus", "par", "ne", "l", "d", "qu", "n", "c", "j",
+    },
+    "en": {
+        "the", "and", "is", "are", "of", "to", "in", "for", "on", "with", "that", "this", "was", "it",
+        "be", "by", "from", "at", "an", "have", "has", "not", "will", "you", "they", "we", "he", "she",
+    },
+    "es": {
+        "el", "los", "las", "del", "y", "es", "por", "con", "para", "una", "su", "al", "lo", "como",
+        "pero", "está", "muy", "sus", "fue", "ha",
+    },
+    "de": {
+        "der", "die", "das", "und", "ist", "nicht", "mit", "auf", "für", "den", "von", "zu", "ein",
+        "eine", "dem", "sich", "auch", "im", "wir", "ich",
+    },
+    "it": {
+        "il", "di", "che", "è", "per", "gli", "della", "non", "sono", "una", "del", "alla", "anche",
+        "nel", "questo", "come",
+    },
+    "pt": {
+        "o", "os", "da", "do", "das", "dos", "em", "não", "uma", "com", "é", "para", "no", "na", "ao",
+        "mais", "foi",
+    },
+}
+WORD_PATTERN = re.compile(r"[a-zà-öø-ÿ]+")
+
+# Nombre de textes tranchés par chaque étage du filtre de langue
+language_filter_stats = {"fast_french": 0, "fast_other": 0, "model": 0}
+
+def get_language_filter_stats():
+    """Renvoie une copie des compteurs du filtre de langue, avec la part tranchée par le filtre rapide."""
+    stats = dict(language_filter_stats)
+    total = sum(stats.values())
+    stats["fast_path_rate"] = (stats["fast_french"] + stats["fast_other"]) / total if total else 0.0
+    return stats
+
+def reset_language_filter_stats():
+    for key in language_filter_stats:
+        language_filter_stats[key] = 0
+
+def quick_language_guess(text, ambiguity_margin=0.15, min_words=4):
+    """
+    Filtre rapide basé sur la proportion de mots-outils de chaque langue.
+    Renvoie True (clairement français), False (clairement une autre langue)
+    ou None si le texte est trop court ou que l'écart entre les langues est inférieur à la marge.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < min_words:
+        return None
+
+    ratios = {
+        language: sum(word in stopwords for word in words) / len(words)
+        for language, stopwords in STOPWORDS.items()
+    }
+    french_ratio = ratios.pop("fr")
+    other_ratio = max(ratios.values())
+
+    if french_ratio - other_ratio >= ambiguity_margin:
+        return True
+    if other_ratio - french_ratio >= ambiguity_margin:
+        return False
+    return None
 
 # Fonction utile pour notre cas où dans une première version, nous ne traitons que les tweets en français
-def filter_by_language(text, confidence_threshold=0.8):
+def filter_by_language(texts, confidence_threshold=0.8, batch_size=32, ambiguity_margin=0.15):
     """
-    Filtre le texte pour ne garder que la langue française.
+    Filtre les textes pour ne garder que la langue française.
+    Prend une liste de textes et renvoie la liste de booléens correspondante. Les cas évidents sont
+    tranchés par le filtre rapide sur les mots-outils ; seuls les textes ambigus (écart inférieur à
+    `ambiguity_margin`) passent par le modèle xlm-roberta, en un seul appel.
+    Un texte seul (str) donne directement un booléen.
     """
-    model_name = "papluca/xlm-roberta-base-language-detection"
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    if isinstance(texts, str):
+        return filter_by_language([texts], confidence_threshold, batch_size, ambiguity_margin)[0]
+    if not texts:
+        return []
 
-    nlp = pipeline("text-classification", model=model, tokenizer=tokenizer)
+    decisions = [quick_language_guess(text, ambiguity_margin) for text in texts]
+    language_filter_stats["fast_french"] += sum(decision is True for decision in decisions)
+    language_filter_stats["fast_other"] += sum(decision is False for decision in decisions)
 
-    result = nlp(text)
-    language = result[0]['label']
-    confidence = result[0]['score']
+    ambiguous = [i for i, decision in enumerate(decisions) if decision is None]
+    if ambiguous:
+        language_filter_stats["model"] += len(ambiguous)
+        nlp = get_language_detector()
+        results = nlp([texts[i] for i in ambiguous], batch_size=batch_size, truncation=True)
+        for i, result in zip(ambiguous, results):
+            decisions[i] = result['label'] == 'fr' and result['score'] >= confidence_threshold
 
-    return language == 'fr' and confidence >= confidence_threshold
+    return decisions
 
 def filter_short_text(text):
     """
@@ -27,43 +116,150 @@ def filter_short_text(text):
     min_length = 3
     return len(text) >= min_length
 
-def normalize_data(brut_text):
+# Motifs compilés une seule fois pour la normalisation
+MENTION_LINK_PATTERN = re.compile(r'#\w+|@\w+|https?://\S+')
+# Un mot est conservé s'il n'est composé que de lettres et d'apostrophes, s'il contient une apostrophe,
+# s'il commence par un emoji converti (:nom:) ou s'il se termine par un unique caractère de ponctuation
+KEPT_WORD_PATTERN = re.compile(r"^(?:[a-zA-ZÀ-ÖØ-öø-ÿ'’]+$|.*['’]|:\w+:|\w+.$)")
+
+def normalize_data(brut_text, verbose=False):
     """
     Normalise le texte en remplaçant les emojis par du texte, en transformant les ligatures pour une meilleure compréhension par les modèles de langage,
     et en supprimant les caractères spéciaux.
     """
 
-    print(f"Original text: {brut_text}")
+    if verbose:
+        print(f"Original text: {brut_text}")
     # Conversion des emojis en texte
     text_with_converted_emoji = emoji.demojize(brut_text, language="fr")
 
     # Suppression des mentions, des liens et des hashtags
-    text_without_mentions_and_links = re.sub(r'#\w+|@\w+|https?://\S+', '', text_with_converted_emoji)
+    text_without_mentions_and_links = MENTION_LINK_PATTERN.sub('', text_with_converted_emoji)
 
     # Suppression des caractères spéciaux
-    words = [
-        word for word in text_without_mentions_and_links.split()
-        if re.match(r"^[a-zA-ZÀ-ÖØ-öø-ÿ'’]+$", word)
-        or "'" in word or "’" in word
-        or re.match(r':\w+:', word) or re.match(r'^\w+.$', word)
-    ]
+    words = [word for word in text_without_mentions_and_links.split() if KEPT_WORD_PATTERN.match(word)]
 
     clean_text = " ".join(words)
 
-    print(f"Cleaned text normalize_data: {clean_text}")
+    if verbose:
+        print(f"Cleaned text normalize_data: {clean_text}")
 
     return clean_text
 
+def normalize_series(series):
+    """
+    Version vectorisée de normalize_data pour une Series pandas, à utiliser pour
+    re-normaliser de gros volumes (par exemple tout l'historique après un changement de règle).
+    """
+    series = series.fillna("").astype(str)
+    original_index = series.index
+    series = series.reset_index(drop=True)
+
+    text_with_converted_emoji = series.map(lambda text: emoji.demojize(text, language="fr"))
+    text_without_mentions_and_links = text_with_converted_emoji.str.replace(MENTION_LINK_PATTERN, '', regex=True)
+
+    # Un mot par ligne, filtrage en une passe, puis reconstitution des textes
+    words = text_without_mentions_and_links.str.split().explode()
+    kept_words = words[words.str.match(KEPT_WORD_PATTERN, na=False)]
+    clean_texts = kept_words.groupby(level=0).agg(" ".join).reindex(series.index, fill_value="")
+
+    clean_texts.index = original_index
+    return clean_texts
+
+# Version de normalize_data appliquée à l'historique par renormalize_history
+NORMALIZATION_VERSION = 1
+
+def renormalize_history(engine, chunk_size=10000, force=False):
+    """
+    Migration ponctuelle : recalcule comments.normalized_content à partir de la réponse brute
+    (comments.content) par blocs d'identifiants, et ne met à jour que les lignes qui changent.
+    Seuls les commentaires sont concernés : les posts ne conservent que leur texte déjà normalisé
+    et lemmatisé, qu'on ne peut pas re-normaliser sans dériver.
+    La migration est enregistrée dans data_migrations par NORMALIZATION_VERSION ; force=True la relance.
+    """
+    from db.create_tables import comments_table, data_migrations_table
+
+    migration_name = f"renormalize_comments_v{NORMALIZATION_VERSION}"
+    with engine.connect() as conn:
+        already_applied = conn.execute(
+            select(data_migrations_table.c.name).where(data_migrations_table.c.name == migration_name)
+        ).first() is not None
+    if already_applied and not force:
+        print(f"comments : re-normalisation déjà appliquée ({migration_name}), rien à faire")
+        return 0
+
+    last_id = 0
+    nb_updated = 0
+    while True:
+        with engine.begin() as conn:
+            chunk = pd.DataFrame(
+                conn.execute(
+                    select(comments_table.c.id, comments_table.c.content, comments_table.c.normalized_content)
+                    .where(comments_table.c.id > last_id)
+                    .order_by(comments_table.c.id)
+                    .limit(chunk_size)
+                ).fetchall(),
+                columns=["id", "content", "normalized_content"]
+            )
+            if chunk.empty:
+                break
+            last_id = int(chunk["id"].iloc[-1])
+
+            chunk["new_content"] = normalize_series(chunk["content"])
+            changed = chunk[chunk["new_content"] != chunk["normalized_content"].fillna("")]
+            if not changed.empty:
+                conn.execute(
+                    update(comments_table)
+                    .where(comments_table.c.id == bindparam("row_id"))
+                    .values(normalized_content=bindparam("new_content")),
+                    [{"row_id": int(row_id), "new_content": content}
+                     for row_id, content in zip(changed["id"], changed["new_content"])]
+                )
+                nb_updated += len(changed)
+        print(f"comments : {nb_updated} ligne(s) re-normalisée(s) jusqu'à l'ID {last_id}")
+
+    with engine.begin() as conn:
+        conn.execute(pg_insert(data_migrations_table).values(name=migration_name).on_conflict_do_nothing())
+    return nb_updated
+
+@lru_cache(maxsize=None)
+def get_french_nlp():
+    """
+    Charge une seule fois le pipeline spaCy français. Le parser et la reconnaissance d'entités
+    sont désactivés : la lemmatisation n'a besoin que des étiquettes morphologiques.
+    """
+    return spacy.load('fr_core_news_sm', disable=["parser", "ner"])
+
+def lemmatization_texts(texts, batch_size=64, n_process=1, verbose=False):
+    """
+    Lemmatise une liste de textes avec nlp.pipe en supprimant les mots vides.
+    `n_process` > 1 répartit les lots sur plusieurs processus.
+    """
+    nlp = get_french_nlp()
+    clean_texts = []
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        clean_text = " ".join(token.lemma_ for token in doc if not token.is_stop)
+        if verbose:
+            print(f"Cleaned text lemmatization_text: {clean_text}")
+        clean_texts.append(clean_text)
+    return clean_texts
+
 def lemmatization_text(text):
-    nlp = spacy.load('fr_core_news_sm')
-    doc = nlp(text)
-    tokens = [token.lemma_ for token in doc if not token.is_stop]
-    clean_text = " ".join(tokens)
-    print(f"Cleaned text lemmatization_text: {clean_text}")
-    return clean_text
+    return lemmatization_texts([text], verbose=True)[0]
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "renormalize-comments":
+        from db.db_connection import get_engine
+        from db.create_tables import upgrade_existing_tables
+
+        engine = get_engine()
+        upgrade_existing_tables(engine)
+        renormalize_history(engine, force="--force" in sys.argv[2:])
+        sys.exit(0)
+
     text = "Hello ❤️. https://www.example.com @user #coucou c'est tout pour moi je suis élégante."
-    normalized_text = normalize_data(text)
+    normalized_text = normalize_data(text, verbose=True)
     lemmatized_text = lemmatization_text(normalized_text)
     print(f"Texte normalisé : {lemmatized_text}")
\ No newline at end of file
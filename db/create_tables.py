@@ -1,4 +1,5 @@
-from sqlalchemy import Table, Column, Integer, Text, Float, TIMESTAMP, Boolean, MetaData, ForeignKey, String, DateTime
+from sqlalchemy import Table, Column, Integer, Text, Float, TIMESTAMP, Boolean, MetaData, ForeignKey, String, DateTime, JSON, UniqueConstraint, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime
 from db.db_connection import get_engine
 
@@ -24,6 +25,7 @@ comments_table = Table(
     Column('id', Integer, primary_key=True, autoincrement=True),
     Column('post_id', Integer),
     Column('content', Text),
+    Column('normalized_content', Text),
     Column('author', String(255)),
     Column('publi_date', DateTime),
     Column('link', String(255), unique=True),
@@ -34,7 +36,7 @@ comments_table = Table(
 
 emotional_analysis_bert = Table("emotional_analysis_bert", metadata,
     Column("id", Integer, primary_key=True),
-    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE")),
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), unique=True),
     Column("anger", Integer, default=0),
     Column("joy", Integer, default=0),
     Column("love", Integer, default=0),
@@ -45,7 +47,7 @@ emotional_analysis_bert = Table("emotional_analysis_bert", metadata,
 
 emotional_analysis_roberta = Table("emotional_analysis_roberta", metadata,
     Column("id", Integer, primary_key=True),
-    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE")),
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), unique=True),
     Column("disgust", Integer, default=0),
     Column("sadness", Integer, default=0),
     Column("fear", Integer, default=0),
@@ -70,7 +72,7 @@ fact_checks_table = Table(
 comprehensive_analysis_table = Table(
     "comprehensive_reliability_analysis", metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False),
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False, unique=True),
     Column("content_category", String(100)),
     Column("content_confidence", Float),
     Column("is_fake_news", Integer, default=0),
@@ -83,9 +85,240 @@ comprehensive_analysis_table = Table(
     Column("global_reliability_score", Float),
     Column("final_category", String(100)),
     Column("confidence_level", String(50)),
+    Column("scoring_version", String(50)),
+    Column("created_at", DateTime, default=datetime.utcnow)
+)
+
+# Sorties brutes des modèles de l'analyse de fiabilité (tous les labels et leurs scores), conservées
+# par révision du modèle : les colonnes dérivées peuvent être recalculées sans relancer l'inférence
+model_outputs_table = Table(
+    "model_outputs", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False),
+    Column("model_key", String(100), nullable=False),
+    Column("model_revision", String(100), nullable=False),
+    Column("outputs", JSON, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    UniqueConstraint("post_id", "model_key", "model_revision")
+)
+
+# Agrégats de comprehensive_reliability_analysis par catégorie finale, tenus à jour à chaque écriture
+# d'analyses (voir model_analysis/fake_news_detection/reliability_summary.py)
+reliability_summary_table = Table(
+    "reliability_summary", metadata,
+    Column("final_category", String(100), primary_key=True),
+    Column("post_count", Integer, nullable=False, default=0),
+    Column("score_sum", Float, nullable=False, default=0),
+    Column("fact_checked_count", Integer, nullable=False, default=0),
+    Column("fake_detected_count", Integer, nullable=False, default=0),
+    Column("real_detected_count", Integer, nullable=False, default=0)
+)
+
+# Analyses ayant les scores globaux les plus bas (nombre de lignes borné)
+reliability_lowest_scores_table = Table(
+    "reliability_lowest_scores", metadata,
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+    Column("global_reliability_score", Float, nullable=False, index=True),
+    Column("final_category", String(100)),
+    Column("is_fake_news", Integer)
+)
+
+# Migrations de données ponctuelles déjà appliquées (ex. re-normalisation de l'historique)
+# Posts récupérés mais écartés (langue, longueur, post inaccessible) : ils ne sont ni enregistrés
+# dans posts ni récupérés à nouveau
+rejected_posts_table = Table(
+    "rejected_posts", metadata,
+    Column("link", String(255), primary_key=True),
+    Column("reason", String(50)),
+    Column("rejected_at", DateTime, server_default=func.now())
+)
+
+data_migrations_table = Table(
+    "data_migrations", metadata,
+    Column("name", String(255), primary_key=True),
+    Column("applied_at", DateTime, server_default=func.now())
+)
+
+# Baux des posts réservés par les workers d'analyse (voir db/work_queue.py)
+analysis_leases_table = Table(
+    "analysis_leases", metadata,
+    Column("analysis", String(50), primary_key=True),
+    Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+    Column("worker_id", String(255)),
+    Column("leased_until", DateTime, nullable=False),
+    # Nombre de réservations du post, et date à laquelle il a été abandonné après trop d'échecs
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column("failed_at", DateTime),
+    Column("last_error", Text)
+)
+
+# Avancement des écritures de chaque analyse (voir AnalysisResultWriter dans db/work_queue.py)
+analysis_checkpoints_table = Table(
+    "analysis_checkpoints", metadata,
+    Column("analysis", String(50), primary_key=True),
+    Column("last_post_id", Integer),
+    Column("rows_written", Integer, default=0),
+    Column("worker_id", String(255)),
+    Column("updated_at", DateTime, server_default=func.now())
+)
+
+translation_cache_table = Table(
+    "translation_cache", metadata,
+    Column("backend", String(100), primary_key=True),
+    Column("source_lang", String(10), primary_key=True),
+    Column("target_lang", String(10), primary_key=True),
+    Column("content_hash", String(64), primary_key=True),
+    Column("translated_text", Text, nullable=False),
     Column("created_at", DateTime, default=datetime.utcnow)
 )
 
+# Sorties brutes des modèles (labels et scores) par modèle, révision et empreinte du texte
+inference_cache_table = Table(
+    "inference_cache", metadata,
+    Column("model_name", String(255), primary_key=True),
+    Column("model_revision", String(100), primary_key=True),
+    Column("text_hash", String(64), primary_key=True),
+    Column("outputs", JSON, nullable=False),
+    Column("last_used_at", DateTime, server_default=func.now(), index=True)
+)
+
+def upgrade_existing_tables(engine):
+    """
+    Ajoute aux tables déjà créées les colonnes apparues depuis (metadata.create_all ne crée que
+    les tables manquantes).
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            ALTER TABLE comprehensive_reliability_analysis ADD COLUMN IF NOT EXISTS scoring_version VARCHAR(50)
+        """))
+        # Cache de traduction par moteur : les traductions antérieures, d'origine inconnue,
+        # sont marquées 'unknown' et ne sont plus resservies
+        conn.execute(text("""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'translation_cache' AND column_name = 'backend'
+                ) THEN
+                    ALTER TABLE translation_cache ADD COLUMN backend VARCHAR(100) NOT NULL DEFAULT 'unknown';
+                    ALTER TABLE translation_cache ALTER COLUMN backend DROP DEFAULT;
+                    ALTER TABLE translation_cache DROP CONSTRAINT translation_cache_pkey;
+                    ALTER TABLE translation_cache ADD PRIMARY KEY (backend, source_lang, target_lang, content_hash);
+                END IF;
+            END $$
+        """))
+        # Tentatives et abandon des posts en échec dans analysis_leases
+        conn.execute(text("""
+            ALTER TABLE analysis_leases
+                ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS failed_at TIMESTAMP,
+                ADD COLUMN IF NOT EXISTS last_error TEXT
+        """))
+        # Texte normalisé des commentaires, à côté de la réponse brute (content)
+        conn.execute(text("""
+            ALTER TABLE comments ADD COLUMN IF NOT EXISTS normalized_content TEXT
+        """))
+        # Complément de reliability_lowest_scores par score croissant
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_comprehensive_reliability_analysis_global_score
+            ON comprehensive_reliability_analysis (global_reliability_score, post_id)
+        """))
+
+def load_known_post_links(engine, chunk_size=10000):
+    """
+    Charge en mémoire l'ensemble des liens (URI) des posts déjà en base ou déjà écartés, pour
+    écarter les doublons du flux avant toute requête réseau ou tout traitement NLP.
+    """
+    known_links = set()
+    with engine.connect() as conn:
+        for column in (posts_table.c.link, rejected_posts_table.c.link):
+            result = conn.execution_options(stream_results=True).execute(select(column))
+            for rows in result.scalars().partitions(chunk_size):
+                known_links.update(rows)
+    return known_links
+
+def record_rejected_posts(engine, links, reason, chunk_size=1000):
+    """Enregistre les liens des posts écartés pour qu'ils ne soient plus récupérés aux lancements suivants."""
+    links = list(dict.fromkeys(links))
+    with engine.begin() as conn:
+        for start in range(0, len(links), chunk_size):
+            conn.execute(
+                pg_insert(rejected_posts_table)
+                .values([{"link": link, "reason": reason} for link in links[start:start + chunk_size]])
+                .on_conflict_do_nothing(index_elements=["link"])
+            )
+
+class PostBatchWriter:
+    """
+    Accumule les posts et leurs commentaires puis les écrit par lots avec des
+    INSERT ... ON CONFLICT (link) DO NOTHING RETURNING id multi-lignes : une seule
+    transaction par lot au lieu d'un SELECT puis d'un INSERT par ligne.
+    """
+
+    def __init__(self, engine, batch_size=500, comment_chunk_size=1000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.comment_chunk_size = comment_chunk_size
+        self.pending = {}  # link du post -> (post, commentaires)
+        self.inserted_posts = 0
+        self.inserted_comments = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # En cas d'erreur, rien n'est écrit : les posts en attente seront récupérés à nouveau
+        # puisque le checkpoint n'est mis à jour qu'après une écriture complète
+        if exc_type is None:
+            self.flush()
+
+    def add(self, obj_post, comments=()):
+        """Ajoute un post (sans clé "comments") et la liste de ses commentaires déjà extraits."""
+        link = obj_post.get("link")
+        if not link:
+            print("Lien du post manquant, on saute ce post.")
+            return
+        self.pending[link] = (obj_post, [comment for comment in comments if comment.get("link")])
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Écrit les posts en attente puis leurs commentaires. Renvoie {link: id} des posts insérés."""
+        if not self.pending:
+            return {}
+
+        pending, self.pending = self.pending, {}
+        with self.engine.begin() as conn:
+            # Les posts déjà présents ne sont pas renvoyés par RETURNING : leurs commentaires sont ignorés
+            result = conn.execute(
+                pg_insert(posts_table)
+                .values([obj_post for obj_post, _ in pending.values()])
+                .on_conflict_do_nothing(index_elements=["link"])
+                .returning(posts_table.c.id, posts_table.c.link)
+            )
+            inserted = {row.link: row.id for row in result}
+
+            comment_rows = {}
+            for link, post_db_id in inserted.items():
+                for comment in pending[link][1]:
+                    comment_rows[comment["link"]] = {**comment, "post_id": post_db_id}
+            comment_rows = list(comment_rows.values())
+
+            nb_comments = 0
+            for start in range(0, len(comment_rows), self.comment_chunk_size):
+                result = conn.execute(
+                    pg_insert(comments_table)
+                    .values(comment_rows[start:start + self.comment_chunk_size])
+                    .on_conflict_do_nothing(index_elements=["link"])
+                    .returning(comments_table.c.id)
+                )
+                nb_comments += len(result.fetchall())
+
+        self.inserted_posts += len(inserted)
+        self.inserted_comments += nb_comments
+        print(f"{len(inserted)} post(s) inséré(s) sur {len(pending)}, {nb_comments} commentaire(s) inséré(s)")
+        return inserted
+
 
 if __name__ == "__main__":
     metadata.create_all(engine)
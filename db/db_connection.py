@@ -1,10 +1,13 @@
 import os
+from functools import lru_cache
 import dotenv
 from sqlalchemy import create_engine
 
 dotenv.load_dotenv()
 
+@lru_cache(maxsize=None)
 def get_engine():
+    """Engine partagé par tous les modules du processus (un seul pool de connexions)."""
     user = os.getenv("PGUSER")
     password = os.getenv("PGPASSWORD")
     host = os.getenv("PGHOST")
@@ -0,0 +1,237 @@
+import os
+import socket
+import time
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db.create_tables import analysis_checkpoints_table
+
+# Tables de résultats des analyses, utilisées pour savoir quels posts restent à traiter
+RESULT_TABLES = {
+    "emotion_roberta": "emotional_analysis_roberta",
+    "emotion_bert": "emotional_analysis_bert",
+    "comprehensive": "comprehensive_reliability_analysis",
+}
+
+# Nombre de réservations d'un post en échec avant qu'il soit abandonné (failed_at renseigné)
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", 3))
+
+def get_worker_id():
+    """Identifiant du processus courant, enregistré avec les baux pour le suivi."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def claim_posts(engine, analysis, limit, lease_seconds=900, worker_id=None):
+    """
+    Réserve jusqu'à `limit` posts non encore analysés pour `analysis`, avec un bail de `lease_seconds`.
+    Les lignes de posts déjà verrouillées par un autre worker sont sautées (SKIP LOCKED) et un bail
+    n'est pris que s'il n'existe pas ou qu'il a expiré : plusieurs workers, sur une ou plusieurs
+    machines, ne reçoivent jamais les mêmes posts. Chaque réservation compte une tentative ; les posts
+    abandonnés (voir record_failures) ne sont plus réservés. Renvoie les identifiants réservés, triés.
+    """
+    result_table = RESULT_TABLES[analysis]
+    with engine.begin() as connection:
+        post_ids = connection.execute(text(f"""
+            WITH candidates AS (
+                SELECT p.id
+                FROM posts p
+                LEFT JOIN {result_table} r ON r.post_id = p.id
+                LEFT JOIN analysis_leases l ON l.post_id = p.id AND l.analysis = :analysis
+                WHERE r.post_id IS NULL
+                AND (l.post_id IS NULL OR (l.leased_until < NOW() AND l.failed_at IS NULL))
+                ORDER BY p.id
+                LIMIT :limit
+                FOR NO KEY UPDATE OF p SKIP LOCKED
+            )
+            INSERT INTO analysis_leases (analysis, post_id, worker_id, leased_until, attempts)
+            SELECT :analysis, id, :worker_id, NOW() + make_interval(secs => :lease_seconds), 1
+            FROM candidates
+            ON CONFLICT (analysis, post_id) DO UPDATE
+            SET worker_id = EXCLUDED.worker_id, leased_until = EXCLUDED.leased_until,
+                attempts = analysis_leases.attempts + 1
+            WHERE analysis_leases.leased_until < NOW() AND analysis_leases.failed_at IS NULL
+            RETURNING post_id
+        """), {
+            "analysis": analysis,
+            "limit": limit,
+            "worker_id": worker_id or get_worker_id(),
+            "lease_seconds": lease_seconds,
+        }).scalars().all()
+    return sorted(post_ids)
+
+def release_posts(connection, analysis, post_ids):
+    """
+    Libère les baux des posts dont le résultat a été écrit. Les posts en échec ne sont pas libérés :
+    ils seront repris par un worker à l'expiration de leur bail.
+    """
+    if post_ids:
+        connection.execute(text("""
+            DELETE FROM analysis_leases WHERE analysis = :analysis AND post_id = ANY(:post_ids)
+        """), {"analysis": analysis, "post_ids": list(post_ids)})
+
+def record_failures(engine, analysis, failures, max_attempts=None):
+    """
+    Enregistre l'erreur des posts en échec [(post_id, erreur)]. Leur bail n'est pas libéré : ils seront
+    repris à son expiration, sauf s'ils ont déjà été réservés `max_attempts` fois (ANALYSIS_MAX_ATTEMPTS
+    par défaut), auquel cas ils sont abandonnés. Renvoie le nombre de posts abandonnés.
+    """
+    if not failures:
+        return 0
+    with engine.begin() as connection:
+        abandoned = connection.execute(text("""
+            UPDATE analysis_leases AS l
+            SET last_error = v.error,
+                failed_at = CASE WHEN l.attempts >= :max_attempts THEN NOW() ELSE l.failed_at END
+            FROM (SELECT UNNEST(CAST(:post_ids AS INTEGER[])) AS post_id, UNNEST(CAST(:errors AS TEXT[])) AS error) AS v
+            WHERE l.analysis = :analysis AND l.post_id = v.post_id
+            RETURNING l.failed_at
+        """), {
+            "analysis": analysis,
+            "max_attempts": max_attempts or ANALYSIS_MAX_ATTEMPTS,
+            "post_ids": [post_id for post_id, _ in failures],
+            "errors": [str(error) for _, error in failures],
+        }).scalars().all()
+    nb_abandoned = sum(1 for failed_at in abandoned if failed_at is not None)
+    if nb_abandoned:
+        print(f"⛔ {nb_abandoned} post(s) abandonné(s) pour {analysis} après {max_attempts or ANALYSIS_MAX_ATTEMPTS} tentative(s)")
+    return nb_abandoned
+
+def count_pending_posts(engine, analysis):
+    """Nombre de posts sans résultat pour `analysis` (baux en cours compris, posts abandonnés exclus)."""
+    with engine.connect() as connection:
+        return connection.execute(text(f"""
+            SELECT COUNT(*)
+            FROM posts p
+            LEFT JOIN {RESULT_TABLES[analysis]} r ON r.post_id = p.id
+            LEFT JOIN analysis_leases l ON l.post_id = p.id AND l.analysis = :analysis
+            WHERE r.post_id IS NULL AND l.failed_at IS NULL
+        """), {"analysis": analysis}).scalar()
+
+def count_failed_posts(engine, analysis):
+    """Nombre de posts abandonnés pour `analysis` après ANALYSIS_MAX_ATTEMPTS échecs."""
+    with engine.connect() as connection:
+        return connection.execute(text("""
+            SELECT COUNT(*) FROM analysis_leases WHERE analysis = :analysis AND failed_at IS NOT NULL
+        """), {"analysis": analysis}).scalar()
+
+def ensure_analysis_constraints(engine):
+    """
+    Ajoute aux bases existantes la contrainte d'unicité sur post_id des tables de résultats
+    (metadata.create_all ne modifie pas les tables déjà créées). Les doublons éventuels sont
+    supprimés en gardant la première analyse de chaque post.
+    """
+    with engine.begin() as connection:
+        for result_table in RESULT_TABLES.values():
+            index_name = f"{result_table}_post_id_key"
+            if connection.execute(text("SELECT to_regclass(:index_name)"), {"index_name": index_name}).scalar():
+                continue
+            connection.execute(text(f"""
+                DELETE FROM {result_table} a
+                USING {result_table} b
+                WHERE a.post_id = b.post_id AND a.id > b.id
+            """))
+            connection.execute(text(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {result_table} (post_id)
+            """))
+
+def get_checkpoint(engine, analysis):
+    """Dernier point d'avancement enregistré pour `analysis` (None si aucune écriture)."""
+    with engine.connect() as connection:
+        return connection.execute(
+            select(analysis_checkpoints_table).where(analysis_checkpoints_table.c.analysis == analysis)
+        ).fetchone()
+
+class AnalysisResultWriter:
+    """
+    Accumule les résultats d'une analyse et les écrit par lots (executemany) toutes les
+    `batch_size` lignes ou toutes les `flush_interval` secondes. Chaque écriture est une seule
+    transaction qui insère les résultats (et les lignes associées, par ex. les sorties brutes des
+    modèles), libère les baux des posts écrits et met à jour le point d'avancement de l'analyse
+    dans analysis_checkpoints : en cas d'arrêt brutal, seul le lot en attente est perdu et ses
+    posts sont repris à l'expiration de leur bail.
+    `on_write(connection, lignes)` est appelé dans la même transaction avec les résultats
+    réellement insérés (hors doublons), par exemple pour tenir à jour des agrégats.
+    """
+
+    def __init__(self, engine, analysis, table, batch_size=500, flush_interval=30.0, worker_id=None, on_write=None):
+        self.engine = engine
+        self.analysis = analysis
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.worker_id = worker_id or get_worker_id()
+        self.on_write = on_write
+        self.pending = []  # (résultat, [(table, ligne associée)])
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+        self.failures = []  # (post_id, erreur) des lignes impossibles à écrire
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def add(self, row, related_rows=()):
+        """Ajoute un résultat (dictionnaire avec post_id) et ses lignes associées [(table, ligne)]."""
+        self.pending.append((row, list(related_rows)))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write(self, connection, entries):
+        related = {}
+        for _, related_rows in entries:
+            for table, related_row in related_rows:
+                related.setdefault(table, []).append(related_row)
+        for table, rows in related.items():
+            connection.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+        inserted_ids = set(connection.execute(
+            pg_insert(self.table).on_conflict_do_nothing(index_elements=["post_id"]).returning(self.table.c.post_id),
+            [row for row, _ in entries]
+        ).scalars())
+        if self.on_write:
+            self.on_write(connection, [row for row, _ in entries if row["post_id"] in inserted_ids])
+
+        post_ids = [row["post_id"] for row, _ in entries]
+        release_posts(connection, self.analysis, post_ids)
+        checkpoint = pg_insert(analysis_checkpoints_table).values(
+            analysis=self.analysis,
+            last_post_id=max(post_ids),
+            rows_written=len(entries),
+            worker_id=self.worker_id,
+            updated_at=func.now()
+        )
+        connection.execute(checkpoint.on_conflict_do_update(
+            index_elements=["analysis"],
+            set_={
+                "last_post_id": func.greatest(analysis_checkpoints_table.c.last_post_id, checkpoint.excluded.last_post_id),
+                "rows_written": analysis_checkpoints_table.c.rows_written + checkpoint.excluded.rows_written,
+                "worker_id": checkpoint.excluded.worker_id,
+                "updated_at": checkpoint.excluded.updated_at,
+            }
+        ))
+
+    def flush(self):
+        """Écrit les résultats en attente. Renvoie le nombre de résultats écrits."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return 0
+
+        pending, self.pending = self.pending, []
+        try:
+            with self.engine.begin() as connection:
+                self.write(connection, pending)
+            written = len(pending)
+        except Exception as e:
+            # Une ligne invalide ne doit pas faire perdre tout le lot : écriture ligne par ligne
+            print(f"⚠️  Écriture groupée impossible ({e}), écriture ligne par ligne")
+            written = 0
+            for entry in pending:
+                try:
+                    with self.engine.begin() as connection:
+                        self.write(connection, [entry])
+                    written += 1
+                except Exception as row_error:
+                    print(f"❌ Erreur pour le post ID {entry[0]['post_id']}: {row_error}")
+                    self.failures.append((entry[0]["post_id"], str(row_error)))
+
+        self.rows_written += written
+        return written
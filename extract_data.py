@@ -1,6 +1,11 @@
+import json
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import spacy
-from clean_data import filter_by_language, filter_short_text, normalize_data, lemmatization_text
+from clean_data import filter_by_language, filter_short_text, normalize_data, lemmatization_text, lemmatization_texts
 
 
 # Function to clean text
@@ -11,13 +16,173 @@ def clean_text(text):
         print(f"Error cleaning text: {e}")
         return text
 
+def parse_date(value):
+    """
+    Convertit une date ISO 8601 (format des records Bluesky ou d'un checkpoint) en datetime UTC.
+    Les dates sans fuseau horaire (colonnes publi_date de PostgreSQL) sont considérées en UTC.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.astimezone(timezone.utc)
+
+def load_checkpoint(path):
+    """
+    Charge le checkpoint d'ingestion du flux.
+    - cursor : position dans un parcours du flux non terminé (None si le dernier parcours est allé au bout)
+    - stop_at : date à laquelle ce parcours non terminé doit s'arrêter
+    - newest_publi_date : date du post le plus récent déjà récupéré
+    - failed_uris : posts dont le fil n'a pas pu être récupéré -> nombre de tentatives, repris au lancement suivant
+    """
+    checkpoint = {"cursor": None, "stop_at": None, "newest_publi_date": None, "failed_uris": {}}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                checkpoint.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Checkpoint illisible ({path}), on repart du début du flux: {e}")
+    return checkpoint
+
+def save_checkpoint(checkpoint, path):
+    """Sauvegarde le checkpoint de manière atomique pour ne jamais laisser un fichier à moitié écrit."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(tmp_path, path)
+
+def fetch_feed_pages(client, feed_uri, cursor=None, page_size=100, max_posts=None, since=None):
+    """
+    Parcourt le flux page par page en suivant le curseur renvoyé par l'API.
+    Génère des tuples (posts de la page, curseur de la page suivante).
+
+    Les posts publiés avant `since` (inclus) sont ignorés et le parcours s'arrête dès qu'une page
+    ne contient plus que des posts déjà connus. Il s'arrête aussi quand le flux est épuisé ou
+    quand au moins `max_posts` posts ont été renvoyés : les pages ne sont jamais tronquées afin
+    que le curseur sauvegardé corresponde exactement à ce qui a été traité.
+    Le curseur généré vaut None quand le parcours est terminé.
+    """
+    nb_posts = 0
+    while True:
+        params = {"feed": feed_uri, "limit": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.app.bsky.feed.get_feed(params)
+
+        page = [
+            post for post in response.feed
+            if since is None or parse_date(post.post.record.created_at) > since
+        ]
+        nb_posts += len(page)
+        cursor = response.cursor
+
+        reached_since = since is not None and len(response.feed) > 0 and len(page) == 0
+        finished = reached_since or not cursor or not response.feed
+        yield page, None if finished else cursor
+
+        if finished or (max_posts is not None and nb_posts >= max_posts):
+            return
+
+def is_transient_error(error):
+    """
+    Indique si une erreur de l'API mérite une nouvelle tentative : limite de débit (429), erreur
+    serveur (5xx) ou erreur réseau (sans réponse HTTP). Les autres erreurs HTTP (post supprimé ou
+    bloqué, requête invalide...) sont définitives.
+    """
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code is None or status_code == 429 or status_code >= 500
+
+def fetch_thread(uri, client, retries=3, backoff=1.0, permanent_failures=None):
+    """
+    Récupère le fil de discussion d'un post (le post détaillé et ses réponses) à partir de son URI.
+    Les erreurs passagères (voir is_transient_error) sont retentées `retries` fois avec une attente
+    croissante (backoff, 2 × backoff, ...) ; une erreur définitive abandonne aussitôt, et l'URI est
+    alors ajoutée à `permanent_failures` s'il est fourni. Renvoie None en cas d'échec.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return client.app.bsky.feed.get_post_thread({"uri": uri})
+        except Exception as e:
+            if not is_transient_error(e):
+                print(f"Post {uri} inaccessible: {e}")
+                if permanent_failures is not None:
+                    permanent_failures.add(uri)
+                return None
+            if attempt == retries:
+                print(f"Erreur lors de la récupération du fil du post {uri}: {e}")
+                return None
+            time.sleep(backoff * 2 ** attempt)
+
+def fetch_post_thread(post, client):
+    """Récupère le fil de discussion d'un post du flux."""
+    return fetch_thread(post.post.uri, client)
+
+def fetch_threads(uris, client, max_in_flight=8, permanent_failures=None):
+    """
+    Récupère les fils de discussion de plusieurs posts en parallèle, avec au plus
+    `max_in_flight` requêtes en cours. Les résultats sont renvoyés dans l'ordre des URIs
+    (None pour les posts dont la récupération a échoué). Les URIs en échec définitif sont
+    ajoutées à `permanent_failures` s'il est fourni.
+    """
+    if max_in_flight <= 1 or len(uris) <= 1:
+        return [fetch_thread(uri, client, permanent_failures=permanent_failures) for uri in uris]
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        return list(executor.map(lambda uri: fetch_thread(uri, client, permanent_failures=permanent_failures), uris))
+
+def fetch_post_threads(posts, client, max_in_flight=8):
+    """Récupère les fils de discussion des posts du flux, dans l'ordre du flux (voir fetch_threads)."""
+    return fetch_threads([post.post.uri for post in posts], client, max_in_flight)
+
 def extract_data_from_post(post, client):
-    uri = post.post.uri
-    res_post = client.app.bsky.feed.get_post_thread({"uri": uri})
-    post_details = res_post.thread.post
-    record = post_details.record
-    content = record.text.replace("\n", " ")
-    isFrench = filter_by_language(content)
+    res_post = fetch_post_thread(post, client)
+    if res_post is None:
+        return None
+    return extract_data_from_thread(res_post)
+
+def get_thread_content(res_post):
+    """Texte brut du post principal d'un fil de discussion."""
+    return res_post.thread.post.record.text.replace("\n", " ")
+
+def extract_data_from_threads(threads, batch_size=64, n_process=1):
+    """
+    Extrait les données d'une page de fils de discussion. La détection de langue et la
+    lemmatisation sont faites en un seul appel pour toute la page.
+    Renvoie les posts retenus dans l'ordre du flux.
+    """
+    threads = [res_post for res_post in threads if res_post is not None]
+    contents = [get_thread_content(res_post) for res_post in threads]
+    return [
+        build_post_data(res_post, content, clean_content)
+        for res_post, content, clean_content in zip(threads, contents, clean_contents(contents, batch_size, n_process))
+        if clean_content is not None
+    ]
+
+def clean_contents(contents, batch_size=64, n_process=1):
+    """
+    Applique à des textes bruts les filtres et le nettoyage de l'ingestion : langue française,
+    longueur minimale, normalisation puis lemmatisation. Renvoie, dans l'ordre des textes, le contenu
+    tel qu'il est enregistré dans posts.content, ou None pour les textes écartés.
+    """
+    french_flags = filter_by_language(contents)
+    kept = [
+        i for i, (content, is_french) in enumerate(zip(contents, french_flags))
+        if is_french and filter_short_text(content)
+    ]
+    lemmatized = lemmatization_texts(
+        [normalize_data(contents[i]) for i in kept], batch_size=batch_size, n_process=n_process
+    )
+    cleaned = [None] * len(contents)
+    for i, clean_content in zip(kept, lemmatized):
+        cleaned[i] = clean_content
+    return cleaned
+
+def extract_data_from_thread(res_post, is_french=None):
+    content = get_thread_content(res_post)
+    isFrench = filter_by_language(content) if is_french is None else is_french
     if not isFrench:
         return None
     isLong = filter_short_text(content)
@@ -25,6 +190,17 @@ def extract_data_from_post(post, client):
         return None
     normalize = normalize_data(content)
     clean_content = lemmatization_text(normalize)
+    return build_post_data(res_post, content, clean_content)
+
+def get_thread_title(res_post):
+    """Titre du lien intégré au post principal d'un fil ("None" s'il n'y en a pas)."""
+    record = res_post.thread.post.record
+    return record.embed.external.title if hasattr(record.embed, 'external') else "None"
+
+def build_post_data(res_post, content, clean_content):
+    post_details = res_post.thread.post
+    uri = post_details.uri
+    record = post_details.record
     author = post_details.author.display_name
     publi_date = record.created_at
     comments = res_post.thread.replies
@@ -37,7 +213,7 @@ def extract_data_from_post(post, client):
     nb_like = post_details.like_count
     nb_comment = post_details.reply_count
     nb_repost = post_details.repost_count
-    title = record.embed.external.title if hasattr(record.embed, 'external') else "None"
+    title = get_thread_title(res_post)
 
     return {
         "title": title,
@@ -64,6 +240,7 @@ def extract_comment_from_post(comment):
 
     return {
         "content": reply,
+        "normalized_content": normalize_data(reply),
         "author": author,
         "publi_date": publi_date,
         "link": link,
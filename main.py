@@ -1,139 +1,217 @@
 import os
+from datetime import datetime, timedelta, timezone
 from atproto_client import Client
 import dotenv
-from sqlalchemy import insert, select
-from extract_data import extract_comment_from_post, extract_data_from_post
+from sqlalchemy import func, select
+from extract_data import (
+    extract_comment_from_post,
+    extract_data_from_threads,
+    fetch_feed_pages,
+    fetch_threads,
+    load_checkpoint,
+    parse_date,
+    save_checkpoint
+)
+from clean_data import get_language_filter_stats
 from db.db_connection import get_engine
-from db.create_tables import metadata, posts_table, comments_table
+from db.create_tables import (
+    metadata,
+    posts_table,
+    PostBatchWriter,
+    load_known_post_links,
+    record_rejected_posts,
+    upgrade_existing_tables
+)
+from db.work_queue import ensure_analysis_constraints
 from model_analysis.emotional.roberta import analyze_posts as analyze_emotions_roberta
 from model_analysis.fake_news_detection.fake_news_detection_roberta import (
     analyze_posts_comprehensive,
     generate_synthetic_report,
     fix_existing_inconsistencies
 )
+from model_analysis.fake_news_detection.reliability_summary import ensure_reliability_summary
 from facts_checks_sources.get_fact_checking_datas import get_fact_checking_data
+from model_analysis.inference_cache import print_cache_stats
+from model_analysis.model_registry import print_load_times
 
-# Charger les variables d'environnement
-dotenv.load_dotenv()
-
-user_name = os.getenv("USER")
-password = os.getenv("PASSWORD")
-did = os.getenv("DID")
-
-# Connexion au client Bluesky
-client = Client()
-client.login(user_name, password)
-
-record_key_france = "aaafczzvnktbe"
-public_feed_uri = f'at://{did}/app.bsky.feed.generator/{record_key_france}'
-print(f"Public feed URI for French press: {public_feed_uri}")
-
-# Récupération des posts
-try:
-    response = client.app.bsky.feed.get_feed({
-        "feed": public_feed_uri,
-        "limit": 2
-    })
-    feed = response.feed
-    print(f"Number of posts retrieved: {len(feed)}")
-except Exception as e:
-    print(f"Error retrieving posts: {e}")
-    feed = []
-
-# Connexion à la base de données
-engine = get_engine()
-metadata.create_all(engine)  # Crée les tables si elles n'existent pas
-
-# Insertion des données
-for post in feed:
-    obj_post = extract_data_from_post(post, client)
-    if obj_post is None:
-        continue
-
-    link = obj_post.get("link")
-    if not link:
-        print("Lien du post manquant, on saute ce post.")
-        continue
-
-    # Vérifier si le post existe déjà
-    with engine.begin() as conn:
-        result = conn.execute(select(posts_table.c.id).where(posts_table.c.link == link))
-        existing_post_id = result.scalar()
-
-    if existing_post_id:
-        print(f"Post déjà présent avec link: {link} (ID {existing_post_id})")
-        continue
-
-    list_comments = obj_post.pop("comments", [])
-
-    # Insertion du post
-    try:
-        with engine.begin() as conn:
-            result = conn.execute(
-                insert(posts_table).returning(posts_table.c.id),
-                obj_post
-            )
-            post_db_id = result.scalar()
-        print(f"Post inséré avec ID {post_db_id}")
-    except Exception as e:
-        print(f"Erreur lors de l'insertion du post: {e}")
-        continue
-
-    # Insertion des commentaires associés
+def extract_comments(list_comments):
+    """Extrait les commentaires d'un post en ignorant ceux qui n'ont pas de lien."""
+    obj_comments = []
     for comment in list_comments:
         obj_comment = extract_comment_from_post(comment)
         if obj_comment is None:
             continue
-
-        obj_comment["post_id"] = post_db_id
-        comment_link = obj_comment.get("link")
-
-        if not comment_link:
+        if not obj_comment.get("link"):
             print("Commentaire sans lien, insertion ignorée.")
             continue
+        obj_comments.append(obj_comment)
+    return obj_comments
+
+def main():
+    # Charger les variables d'environnement
+    dotenv.load_dotenv()
+
+    user_name = os.getenv("USER")
+    password = os.getenv("PASSWORD")
+    did = os.getenv("DID")
+
+    # Connexion au client Bluesky
+    client = Client()
+    client.login(user_name, password)
+
+    record_key_france = "aaafczzvnktbe"
+    public_feed_uri = f'at://{did}/app.bsky.feed.generator/{record_key_france}'
+    print(f"Public feed URI for French press: {public_feed_uri}")
+
+    # Paramètres d'ingestion du flux
+    feed_page_size = int(os.getenv("FEED_PAGE_SIZE", 100))  # 100 est le maximum accepté par l'API
+    feed_max_posts = int(os.getenv("FEED_MAX_POSTS", 1000))
+    feed_window_hours = os.getenv("FEED_WINDOW_HOURS")
+    checkpoint_path = os.getenv("FEED_CHECKPOINT_PATH", "feed_checkpoint.json")
+    fetch_concurrency = int(os.getenv("FETCH_CONCURRENCY", 8))  # requêtes get_post_thread simultanées
+    spacy_n_process = int(os.getenv("SPACY_N_PROCESS", 1))  # processus utilisés pour la lemmatisation
+    analysis_workers = int(os.getenv("ANALYSIS_WORKERS", 1))  # processus utilisés pour l'analyse de fiabilité
+    fetch_max_attempts = int(os.getenv("FETCH_MAX_ATTEMPTS", 5))  # lancements successifs avant d'abandonner un post
+
+    # Connexion à la base de données
+    engine = get_engine()
+    metadata.create_all(engine)  # Crée les tables si elles n'existent pas
+    upgrade_existing_tables(engine)  # Ajoute les colonnes récentes aux tables existantes
+    ensure_analysis_constraints(engine)  # Unicité des résultats d'analyse par post
+    ensure_reliability_summary(engine)  # Résumé utilisé par le rapport de fiabilité
+
+    # Reprise depuis le checkpoint : soit on termine un parcours interrompu à partir de son curseur,
+    # soit on repart du haut du flux jusqu'au post le plus récent déjà récupéré
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint["newest_publi_date"] is None:
+        with engine.connect() as conn:
+            newest_in_db = conn.execute(select(func.max(posts_table.c.publi_date))).scalar()
+        checkpoint["newest_publi_date"] = parse_date(newest_in_db).isoformat() if newest_in_db else None
+
+    if checkpoint["cursor"]:
+        print(f"Reprise du parcours interrompu (curseur {checkpoint['cursor']})")
+    else:
+        checkpoint["stop_at"] = checkpoint["newest_publi_date"]
+
+    since = parse_date(checkpoint["stop_at"])
+    if feed_window_hours:
+        window_start = datetime.now(timezone.utc) - timedelta(hours=float(feed_window_hours))
+        since = max(since, window_start) if since else window_start
+
+    # Récupération des posts page par page
+    nb_posts_retrieved = 0
+    post_writer = PostBatchWriter(engine)
+    known_links = load_known_post_links(engine)
+    print(f"{len(known_links)} post(s) déjà présents en base")
+
+    def ingest_threads(uris):
+        """
+        Récupère les fils des posts puis enregistre ceux qui sont retenus. Seuls les posts récupérés
+        sont ajoutés à known_links ; les échecs passagers sont notés dans le checkpoint pour être repris
+        au lancement suivant (abandonnés après fetch_max_attempts lancements), les échecs définitifs
+        (post supprimé ou bloqué) sont abandonnés aussitôt. Les posts écartés sont notés dans rejected_posts.
+        """
+        permanent_failures = set()
+        threads = fetch_threads(uris, client, max_in_flight=fetch_concurrency, permanent_failures=permanent_failures)
+        failed_uris = checkpoint["failed_uris"]
+        for uri, res_post in zip(uris, threads):
+            if res_post is not None or uri in permanent_failures:
+                known_links.add(uri)
+                failed_uris.pop(uri, None)
+                continue
+            failed_uris[uri] = failed_uris.get(uri, 0) + 1
+            if failed_uris[uri] >= fetch_max_attempts:
+                print(f"Post {uri} abandonné après {failed_uris[uri]} tentative(s)")
+                del failed_uris[uri]
+
+        # Insertion des données par lots, écrites avant la mise à jour du checkpoint
+        kept_links = set()
+        for obj_post in extract_data_from_threads(threads, n_process=spacy_n_process):
+            list_comments = obj_post.pop("comments", None) or []
+            kept_links.add(obj_post["link"])
+            post_writer.add(obj_post, extract_comments(list_comments))
+        post_writer.flush()
+
+        # Les posts écartés sont conservés en base pour ne pas être récupérés et filtrés à nouveau
+        filtered_links = [
+            uri for uri, res_post in zip(uris, threads) if res_post is not None and uri not in kept_links
+        ]
+        if filtered_links:
+            record_rejected_posts(engine, filtered_links, "filtered")
+        if permanent_failures:
+            record_rejected_posts(engine, permanent_failures, "unavailable")
 
-        # Vérifier si le commentaire existe déjà
-        with engine.begin() as conn:
-            result = conn.execute(select(comments_table.c.id).where(comments_table.c.link == comment_link))
-            existing_comment_id = result.scalar()
+    try:
+        # Nouvelle tentative pour les posts dont le fil n'a pas pu être récupéré lors des lancements précédents
+        retry_uris = [uri for uri in checkpoint["failed_uris"] if uri not in known_links]
+        checkpoint["failed_uris"] = {uri: checkpoint["failed_uris"][uri] for uri in retry_uris}
+        if retry_uris:
+            print(f"Nouvelle tentative pour {len(retry_uris)} post(s) non récupéré(s) précédemment")
+            ingest_threads(retry_uris)
+            save_checkpoint(checkpoint, checkpoint_path)
+
+        for feed, next_cursor in fetch_feed_pages(client, public_feed_uri, cursor=checkpoint["cursor"],
+                                                   page_size=feed_page_size, max_posts=feed_max_posts, since=since):
+            nb_posts_retrieved += len(feed)
+            print(f"Number of posts retrieved: {nb_posts_retrieved}")
+
+            # Les posts déjà connus sont écartés directement depuis la réponse du flux
+            new_uris = list(dict.fromkeys(post.post.uri for post in feed if post.post.uri not in known_links))
+            if len(new_uris) < len(feed):
+                print(f"{len(feed) - len(new_uris)} post(s) déjà connu(s) ignoré(s)")
+
+            # Récupération concurrente des fils de discussion, puis extraction dans l'ordre du flux
+            ingest_threads(new_uris)
+
+            # Mise à jour du checkpoint une fois la page entièrement stockée (les posts en échec
+            # y sont notés dans failed_uris et ne sont donc pas perdus en avançant le curseur)
+            page_dates = [parse_date(post.post.record.created_at) for post in feed]
+            if checkpoint["newest_publi_date"]:
+                page_dates.append(parse_date(checkpoint["newest_publi_date"]))
+            if page_dates:
+                checkpoint["newest_publi_date"] = max(page_dates).isoformat()
+            checkpoint["cursor"] = next_cursor
+            if next_cursor is None:
+                checkpoint["stop_at"] = None
+            save_checkpoint(checkpoint, checkpoint_path)
+    except Exception as e:
+        print(f"Error retrieving posts: {e}")
+    print(f"{post_writer.inserted_posts} post(s) et {post_writer.inserted_comments} commentaire(s) insérés")
+    language_stats = get_language_filter_stats()
+    print(f"Filtre de langue: {language_stats['fast_french'] + language_stats['fast_other']} texte(s) tranché(s) par le filtre rapide, "
+          f"{language_stats['model']} par le modèle ({language_stats['fast_path_rate']:.0%} évités)")
 
-        if existing_comment_id:
-            print(f"Commentaire déjà présent avec link: {comment_link} (ID {existing_comment_id})")
-            continue
+    # Lancement des analyses émotionnelles
+    try:
+        print("Démarrage de l'analyse émotionnelle...")
+        analyze_emotions_roberta()
+        print("Analyse émotionnelle terminée.")
+    except Exception as e:
+        print(f"Erreur lors de l'analyse émotionnelle: {e}")
+
+    # Lancement de l'analyse de détection de désinformation
+    try:
+        print("🔍 ANALYSE COMPLÈTE DE FIABILITÉ AVEC ROBERTA")
+        print("Fonctionnalités: Classification, Détection fake news, Utilisation des fact-checks existants")
+
+        # Message d'information sur la complémentarité
+        print("\n💡 Exécution du script get_fact_checking_datas")
+        get_fact_checking_data()
+
+        # Corriger les incohérences existantes
+        fix_existing_inconsistencies()
+
+        # Lancer l'analyse complète
+        analyze_posts_comprehensive(workers=analysis_workers)
+
+        # Générer le rapport
+        generate_synthetic_report()
+        print("Analyse de détection de désinformation terminée.")
+    except Exception as e:
+        print(f"Erreur lors de l'analyse de détection de désinformation: {e}")
+
+    print_load_times()
+    print_cache_stats()
 
-        # Insertion du commentaire
-        try:
-            with engine.begin() as conn:
-                conn.execute(insert(comments_table), obj_comment)
-            print(f"Commentaire inséré pour le post ID {post_db_id}")
-        except Exception as e:
-            print(f"Erreur lors de l'insertion du commentaire: {e}")
-
-# Lancement des analyses émotionnelles
-try:
-    print("Démarrage de l'analyse émotionnelle...")
-    analyze_emotions_roberta()
-    print("Analyse émotionnelle terminée.")
-except Exception as e:
-    print(f"Erreur lors de l'analyse émotionnelle: {e}")
-
-# Lancement de l'analyse de détection de désinformation
-try:
-    print("🔍 ANALYSE COMPLÈTE DE FIABILITÉ AVEC ROBERTA")
-    print("Fonctionnalités: Classification, Détection fake news, Utilisation des fact-checks existants")
-    
-    # Message d'information sur la complémentarité
-    print("\n💡 Exécution du script get_fact_checking_datas")
-    get_fact_checking_data()
-    
-    # Corriger les incohérences existantes
-    fix_existing_inconsistencies()
-    
-    # Lancer l'analyse complète
-    analyze_posts_comprehensive()
-    
-    # Générer le rapport
-    generate_synthetic_report()
-    print("Analyse de détection de désinformation terminée.")
-except Exception as e:
-    print(f"Erreur lors de l'analyse de détection de désinformation: {e}")
+if __name__ == "__main__":
+    main()
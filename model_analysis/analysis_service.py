@@ -0,0 +1,287 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from dotenv import load_dotenv
+from sqlalchemy import text
+from db.db_connection import get_engine
+from extract_data import clean_contents, fetch_thread, get_thread_content, get_thread_title
+from db.create_tables import metadata, upgrade_existing_tables
+from db.work_queue import ensure_analysis_constraints
+from model_analysis.fake_news_detection.fake_news_detection_roberta import (
+    comprehensive_analysis_with_outputs,
+    get_external_fact_check_data_batch,
+    store_analysis
+)
+from model_analysis.fake_news_detection.reliability_summary import ensure_reliability_summary
+from model_analysis.inference_cache import get_cache_stats
+from model_analysis.model_registry import get_load_times
+
+load_dotenv()
+
+engine = get_engine()
+
+# Taille maximale d'un texte envoyé directement au service (caractères)
+MAX_TEXT_LENGTH = 10000
+# Temps maximal d'attente d'un résultat par requête (secondes)
+REQUEST_TIMEOUT = 30
+
+class MicroBatcher:
+    """
+    Regroupe les analyses demandées en même temps par plusieurs requêtes : un seul thread exécute
+    les modèles, sur des lots d'au plus `max_batch_size` textes constitués pendant au plus
+    `max_wait` secondes après la première demande. Chaque demande reçoit un Future ; une demande
+    annulée (délai dépassé) avant le traitement de son lot n'est pas analysée.
+    """
+
+    def __init__(self, max_batch_size=16, max_wait=0.01):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        # Compteurs lus par /health depuis les threads des requêtes
+        self.stats_lock = threading.Lock()
+        self.nb_batches = 0
+        self.nb_items = 0
+        self.thread = threading.Thread(target=self.run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, post_id, full_text):
+        """Demande l'analyse d'un texte (post_id None pour un texte hors base)."""
+        future = Future()
+        self.pending.put((post_id, full_text, future))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.process(batch)
+
+    def stats(self):
+        with self.stats_lock:
+            return {"batches": self.nb_batches, "batched_requests": self.nb_items}
+
+    def process(self, batch):
+        batch = [(post_id, full_text, future) for post_id, full_text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        posts = [(post_id, full_text) for post_id, full_text, _ in batch]
+        try:
+            fact_checks = get_external_fact_check_data_batch([post_id for post_id, _ in posts if post_id is not None])
+            results = comprehensive_analysis_with_outputs(posts, batch_size=len(posts), fact_checks=fact_checks)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        with self.stats_lock:
+            self.nb_batches += 1
+            self.nb_items += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+@lru_cache(maxsize=1)
+def get_bluesky_client():
+    """Client Bluesky connecté, pour analyser un post qui n'est pas encore en base."""
+    from atproto_client import Client
+
+    client = Client()
+    client.login(os.getenv("USER"), os.getenv("PASSWORD"))
+    return client
+
+def full_post_text(title, content):
+    """Texte analysé d'un post : titre du lien intégré et contenu nettoyé, comme pour l'analyse par lots."""
+    return f"{title} {content}" if title and title != "None" else content or ""
+
+# Réponse pour un texte que l'ingestion aurait écarté : son analyse ne serait pas comparable
+FILTERED_TEXT_ERROR = {"error": "Texte écarté par les filtres de l'ingestion (langue autre que le français ou texte trop court)"}
+
+class AnalysisService:
+    """
+    Analyse à la demande d'un post (par id ou URI) ou d'un texte. Une analyse déjà enregistrée est
+    renvoyée directement ; sinon le texte passe par le MicroBatcher, dont les modèles restent chargés
+    et dont les sorties déjà calculées sont lues dans le cache d'inférence. Les analyses de posts
+    présents en base sont enregistrées comme celles du traitement par lots. Un post absent de la base
+    ou un texte libre passe d'abord par les filtres et le nettoyage de l'ingestion (extract_data),
+    pour obtenir le même verdict qu'une fois le post ingéré. Un texte dont une sortie
+    de modèle manque donne une erreur 503 (rien n'est enregistré), un délai dépassé une erreur 504.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    def compute(self, post_id, full_text):
+        """
+        Analyse d'un texte par le MicroBatcher : (statut HTTP d'erreur ou None, corps JSON d'erreur
+        ou (analyse, lignes de sorties brutes)).
+        """
+        future = self.batcher.submit(post_id, full_text)
+        try:
+            result = future.result(REQUEST_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            return 504, {"error": f"Analyse non terminée après {REQUEST_TIMEOUT}s, réessayez plus tard"}
+        if result is None:
+            return 503, {"error": "Sorties des modèles indisponibles pour ce texte, analyse non enregistrée"}
+        return None, result
+
+    def analyze(self, payload):
+        """Renvoie (statut HTTP, corps JSON) pour une requête {post_id}, {uri} ou {text}."""
+        if not isinstance(payload, dict):
+            return 400, {"error": "Corps JSON attendu: {\"post_id\": ...}, {\"uri\": ...} ou {\"text\": ...}"}
+
+        if payload.get("post_id") is not None or payload.get("uri"):
+            if payload.get("post_id") is not None:
+                try:
+                    condition, params = "id = :post_id", {"post_id": int(payload["post_id"])}
+                except (TypeError, ValueError):
+                    return 400, {"error": "post_id doit être un entier"}
+            else:
+                condition, params = "link = :uri", {"uri": payload["uri"]}
+
+            with engine.connect() as connection:
+                post = connection.execute(text(f"SELECT id, title, content FROM posts WHERE {condition}"), params).fetchone()
+                if post:
+                    stored = connection.execute(text("""
+                        SELECT * FROM comprehensive_reliability_analysis WHERE post_id = :post_id
+                    """), {"post_id": post.id}).fetchone()
+                    if stored:
+                        analysis_data = dict(stored._mapping)
+                        analysis_data.pop("id", None)
+                        return 200, {**analysis_data, "source": "stored"}
+
+            if post:
+                status, result = self.compute(post.id, full_post_text(post.title, post.content))
+                if status:
+                    return status, result
+                analysis_data, output_rows = result
+                with engine.begin() as connection:
+                    store_analysis(connection, analysis_data, output_rows)
+                return 200, {**analysis_data, "source": "computed"}
+            if payload.get("post_id") is not None:
+                return 404, {"error": f"Post avec ID {payload['post_id']} non trouvé"}
+
+            # Post absent de la base : analyse de son texte nettoyé comme à l'ingestion, sans enregistrement
+            permanent_failures = set()
+            try:
+                res_post = fetch_thread(payload["uri"], get_bluesky_client(), permanent_failures=permanent_failures)
+            except Exception as e:
+                return 502, {"error": f"Impossible de récupérer le post {payload['uri']}: {e}"}
+            if permanent_failures:
+                return 404, {"error": f"Post {payload['uri']} inaccessible (supprimé, bloqué ou URI invalide)"}
+            if res_post is None:
+                return 502, {"error": f"Impossible de récupérer le post {payload['uri']}"}
+            clean_content = clean_contents([get_thread_content(res_post)])[0]
+            if clean_content is None:
+                return 422, FILTERED_TEXT_ERROR
+            status, result = self.compute(None, full_post_text(get_thread_title(res_post), clean_content))
+            if status:
+                return status, result
+            return 200, {**result[0], "uri": payload["uri"], "source": "computed"}
+
+        full_text = payload.get("text")
+        if not isinstance(full_text, str) or not full_text.strip():
+            return 400, {"error": "Corps JSON attendu: {\"post_id\": ...}, {\"uri\": ...} ou {\"text\": ...}"}
+        if len(full_text) > MAX_TEXT_LENGTH:
+            return 413, {"error": f"Texte trop long (maximum {MAX_TEXT_LENGTH} caractères)"}
+        clean_content = clean_contents([full_text.replace("\n", " ")])[0]
+        if clean_content is None:
+            return 422, FILTERED_TEXT_ERROR
+        status, result = self.compute(None, clean_content)
+        if status:
+            return status, result
+        return 200, {**result[0], "source": "computed"}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "models": sorted(get_load_times()),
+            **self.batcher.stats(),
+            "inference_cache": get_cache_stats(),
+        }
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health : état du service
+    GET /analyze?post_id=...|uri=...|text=... ou POST /analyze avec un corps JSON équivalent
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self.send_json(200, self.server.service.health())
+        elif url.path == "/analyze":
+            self.handle_analyze({key: values[0] for key, values in parse_qs(url.query).items()})
+        else:
+            self.send_json(404, {"error": f"Chemin inconnu: {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/analyze":
+            self.send_json(404, {"error": f"Chemin inconnu: {self.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "JSON invalide"})
+            return
+        self.handle_analyze(payload)
+
+    def handle_analyze(self, payload):
+        start_time = time.monotonic()
+        try:
+            status, body = self.server.service.analyze(payload)
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+        body["latency_ms"] = round((time.monotonic() - start_time) * 1000, 1)
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve(host=None, port=None, max_batch_size=None, max_wait_ms=None):
+    """Démarre le service d'analyse après avoir chargé tous les modèles."""
+    host = host or os.getenv("ANALYSIS_SERVICE_HOST", "127.0.0.1")
+    port = int(port or os.getenv("ANALYSIS_SERVICE_PORT", 8080))
+    max_batch_size = int(max_batch_size or os.getenv("ANALYSIS_SERVICE_MAX_BATCH", 16))
+    max_wait_ms = float(max_wait_ms or os.getenv("ANALYSIS_SERVICE_MAX_WAIT_MS", 10))
+
+    metadata.create_all(engine)
+    upgrade_existing_tables(engine)
+    ensure_analysis_constraints(engine)
+    ensure_reliability_summary(engine)
+
+    # Chargement des modèles (et du moteur de traduction) avant d'accepter des requêtes
+    print("⏳ Chargement des modèles...")
+    comprehensive_analysis_with_outputs([(None, "Le gouvernement a annoncé une réforme des retraites.")])
+
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    server.service = AnalysisService(MicroBatcher(max_batch_size, max_wait_ms / 1000))
+    print(f"✅ Service d'analyse prêt sur http://{host}:{port} (lots de {max_batch_size} textes, attente max {max_wait_ms:.0f} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Arrêt du service d'analyse")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    # Usage : python -m model_analysis.analysis_service
+    serve()
@@ -0,0 +1,145 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import text
+from db.work_queue import AnalysisResultWriter, claim_posts, record_failures
+from model_analysis import inference_cache
+from model_analysis.model_registry import MODEL_SPECS, get_model_revision, get_pipeline
+from model_analysis.translation import translate_texts
+
+# torch.set_num_threads modifie un réglage global au processus : un seul bloc split_torch_threads
+# à la fois, pour que deux appelants concurrents ne restaurent pas la valeur l'un de l'autre
+torch_threads_lock = threading.Lock()
+
+@contextmanager
+def split_torch_threads(nb_concurrent_models):
+    """
+    Répartit les threads de calcul de torch entre plusieurs modèles exécutés en parallèle.
+    Le pool intra-op de torch est global au processus : chaque inférence concurrente en utiliserait
+    sinon la totalité, ce qui surchargerait les cœurs. Le réglage précédent est restauré à la sortie.
+    Le réglage valant pour tout le processus, les blocs sont exécutés l'un après l'autre
+    (torch_threads_lock) ; les inférences lancées hors de ce bloc pendant ce temps utilisent
+    elles aussi le nombre réduit de threads.
+    """
+    import torch
+
+    with torch_threads_lock:
+        previous_threads = torch.get_num_threads()
+        torch.set_num_threads(max(1, previous_threads // nb_concurrent_models))
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous_threads)
+
+def sort_by_token_length(nlp, texts):
+    """Indices des textes triés par nombre de tokens, pour regrouper des textes de longueur proche."""
+    lengths = [len(input_ids) for input_ids in nlp.tokenizer(list(texts), truncation=True)["input_ids"]]
+    return sorted(range(len(texts)), key=lambda i: lengths[i])
+
+def run_batched(model_key, texts, batch_size=16, use_cache=True):
+    """
+    Exécute le pipeline `model_key` du registre sur tous les textes par lots de `batch_size`.
+    Les sorties déjà calculées par la même révision du modèle sont lues dans le cache d'inférence
+    (sans charger le modèle quand tous les textes y sont) ;
+    les autres textes sont triés par longueur en tokens avant d'être découpés en lots afin de limiter
+    le padding. Les sorties complètes (tous les labels et leurs scores) sont renvoyées dans l'ordre
+    d'origine et enregistrées dans le cache.
+    """
+    if not texts:
+        return []
+
+    model_name = MODEL_SPECS[model_key]["model_name"]
+    model_revision = get_model_revision(model_key)
+
+    results = inference_cache.lookup(model_name, model_revision, texts) if use_cache else [None] * len(texts)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    # Le modèle n'est chargé que s'il reste des textes à calculer
+    nlp = get_pipeline(model_key)
+    missing_texts = [texts[i] for i in missing]
+    order = sort_by_token_length(nlp, missing_texts)
+    for start in range(0, len(order), batch_size):
+        batch_indices = order[start:start + batch_size]
+        outputs = nlp([missing_texts[i] for i in batch_indices], batch_size=len(batch_indices), truncation=True, top_k=None)
+        for i, output in zip(batch_indices, outputs):
+            results[missing[i]] = output
+
+    if use_cache:
+        inference_cache.store(model_name, model_revision, missing_texts, [results[i] for i in missing])
+    return results
+
+def as_score_list(output):
+    """Normalise la sortie d'un pipeline pour un texte en liste de {label, score}."""
+    if isinstance(output, dict):
+        return [output]
+    if output and isinstance(output[0], list):
+        return output[0]
+    return output
+
+def map_with_fallback(function, items, error_message="Erreur"):
+    """
+    Applique `function` (liste -> liste de résultats alignée) à tous les éléments en un seul appel ;
+    si cet appel échoue, chaque élément est repris seul, pour que seuls les éléments fautifs échouent.
+    Renvoie (résultats alignés sur `items`, None pour les éléments en échec ; liste de (indice, erreur)).
+    """
+    items = list(items)
+    try:
+        return list(function(items)), []
+    except Exception as e:
+        if len(items) <= 1:
+            print(f"{error_message}: {e}")
+            return [None] * len(items), [(i, str(e)) for i in range(len(items))]
+        print(f"{error_message} sur le lot ({e}), reprise élément par élément")
+
+    results, failures = [], []
+    for i, item in enumerate(items):
+        try:
+            results.append(function([item])[0])
+        except Exception as e:
+            print(f"{error_message}: {e}")
+            results.append(None)
+            failures.append((i, str(e)))
+    return results, failures
+
+def label_scores_rows(model_key, labels, posts, batch_size=16):
+    """
+    Traduit le contenu d'une liste de (post_id, content) puis l'analyse avec le modèle `model_key` ;
+    renvoie pour chaque post une ligne {post_id, <label>: score en pourcentage} pour les `labels`
+    demandés (0 pour un label absent de la sortie), dans l'ordre des posts.
+    """
+    translated_contents = translate_texts([content or "" for _, content in posts])
+    outputs = run_batched(model_key, translated_contents, batch_size)
+    rows = []
+    for (post_id, _), output in zip(posts, outputs):
+        scores = {prediction["label"]: int(prediction["score"] * 100) for prediction in as_score_list(output)}
+        rows.append({"post_id": post_id, **{label: scores.get(label, 0) for label in labels}})
+    return rows
+
+def analyze_post_queue(engine, model_key, table, labels, batch_size=16, chunk_size=256, lease_seconds=900):
+    """
+    Analyse avec le modèle `model_key` les posts sans résultat dans `table` : les posts sont réservés par
+    blocs de `chunk_size` (plusieurs workers peuvent tourner en même temps sans traiter deux fois le même
+    post), traduits puis passés au modèle en lots de `batch_size` textes de longueur proche
+    (label_scores_rows). Un bloc en échec est repris post par post (map_with_fallback) ; les posts qui
+    échouent seuls gardent leur bail et sont abandonnés après ANALYSIS_MAX_ATTEMPTS tentatives.
+    Les résultats sont écrits par lots avec un point d'avancement (voir AnalysisResultWriter).
+    """
+    with engine.connect() as connection, AnalysisResultWriter(engine, model_key, table) as writer:
+        while post_ids := claim_posts(engine, model_key, chunk_size, lease_seconds):
+            chunk = connection.execute(text("""
+                SELECT id, content FROM posts WHERE id = ANY(:post_ids) ORDER BY id
+            """), {"post_ids": post_ids}).fetchall()
+            connection.commit()
+            rows, failures = map_with_fallback(
+                lambda posts: label_scores_rows(model_key, labels, posts, batch_size),
+                [(post_id, content) for post_id, content in chunk],
+                f"Erreur lors de l'analyse {model_key}"
+            )
+            record_failures(engine, model_key, [(chunk[i].id, error) for i, error in failures])
+            for row in rows:
+                if row is not None:
+                    writer.add(row)
+            print(f"Analyse {model_key} pour {writer.rows_written + len(writer.pending)} posts")
+    record_failures(engine, model_key, writer.failures)
+    return writer.rows_written
@@ -1,56 +1,21 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
-from sqlalchemy import text
 from db.db_connection import get_engine
-from deep_translator import GoogleTranslator
 from db.create_tables import emotional_analysis_bert
+from model_analysis.batching import analyze_post_queue, label_scores_rows
 
-model_name = "bhadresh-savani/distilbert-base-uncased-emotion"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSequenceClassification.from_pretrained(model_name)
-emotion_pipeline_bert = pipeline("text-classification", model=model, tokenizer=tokenizer, top_k=None)
+MODEL_KEY = "emotion_bert"
+# Colonnes de emotional_analysis_bert, une par label du modèle
+EMOTIONS = ("anger", "joy", "love", "sadness", "fear", "surprise")
 
 engine = get_engine()
-translator_bert = GoogleTranslator(source='fr', target='en')
 
-def analyze_posts():
-    with engine.connect() as connection:
-        # Recuperer les posts qui n ont pas encore ete analyses
-        posts_table = connection.execute(text("""
-            SELECT p.id, p.content 
-            FROM posts p
-            LEFT JOIN emotional_analysis_bert eab 
-            ON p.id = eab.post_id
-            WHERE eab.post_id IS NULL
-            ORDER BY p.id
-        """)).fetchall()
-
-        for post in posts_table:
-            post_id, content = post
-            try:
-                emotional_data = analyze_emotions(content, post_id)
-            except Exception as e:
-                print(f"Erreur lors de l analyse des emotions pour le post ID {post_id}: {e}")
-                continue
-            connection.execute(emotional_analysis_bert.insert(), emotional_data)
-            connection.commit()
+def analyze_posts(batch_size=16, chunk_size=256, lease_seconds=900):
+    """Analyse les émotions des posts non encore traités (voir analyze_post_queue)."""
+    return analyze_post_queue(engine, MODEL_KEY, emotional_analysis_bert, EMOTIONS, batch_size, chunk_size, lease_seconds)
 
 def analyze_emotions(content, post_id):
-    translated_content = translator_bert.translate(content)
-    emotions = emotion_pipeline_bert(translated_content)
-    emotion_scores = {emotion['label']: int(emotion['score'] * 100) for emotion in emotions[0]}
-    emotional_data = {
-        "post_id": post_id,
-        "anger": emotion_scores.get("anger", 0),
-        "joy": emotion_scores.get("joy", 0),
-        "love": emotion_scores.get("love", 0),
-        "sadness": emotion_scores.get("sadness", 0),
-        "fear": emotion_scores.get("fear", 0),
-        "surprise": emotion_scores.get("surprise", 0),
-    }
+    emotional_data = label_scores_rows(MODEL_KEY, EMOTIONS, [(post_id, content)])[0]
     print(f"Analyse emotionnelle pour le post ID {post_id}")
     return emotional_data
-    
-    
 
 if __name__ == "__main__":
-    analyze_posts()
\ No newline at end of file
+    analyze_posts()
@@ -1,5 +1,5 @@
-from model_analysis.emotional.bert import emotion_pipeline_bert, translator_bert
-from model_analysis.emotional.roberta import emotion_pipeline_roberta, translator_roberta
+from model_analysis.model_registry import get_pipeline
+from model_analysis.translation import translate
 from sklearn.metrics import classification_report, confusion_matrix
 import time
 import matplotlib.pyplot as plt
@@ -26,10 +26,10 @@ test_data = [
     {"text": "Oh, merci, c'est tellement utile... ou pas.", "label": "sarcasm"},
 ]
 
-def get_predictions(pipeline, translator, data):
+def get_predictions(pipeline, data):
     predictions = []
     for item in data:
-        translated_text = translator.translate(item["text"])
+        translated_text = translate(item["text"])
         emotions = pipeline(translated_text)
         predicted_label = max(emotions[0], key=lambda x: x["score"])["label"]
         predictions.append(predicted_label)
@@ -39,12 +39,12 @@ true_labels = [item["label"] for item in test_data]
 
 # BERT
 start_time = time.time()
-bert_predictions = get_predictions(emotion_pipeline_bert, translator_bert, test_data)
+bert_predictions = get_predictions(get_pipeline("emotion_bert"), test_data)
 bert_time = time.time() - start_time
 
 # RoBERTa
 start_time = time.time()
-roberta_predictions = get_predictions(emotion_pipeline_roberta, translator_roberta, test_data)
+roberta_predictions = get_predictions(get_pipeline("emotion_roberta"), test_data)
 roberta_time = time.time() - start_time
 
 print("\n=== Résultats pour BERT ===")
@@ -1,250 +1,199 @@
+import multiprocessing
+import os
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import pandas as pd
 from dotenv import load_dotenv
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
-from sqlalchemy import text
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from db.db_connection import get_engine
-from deep_translator import GoogleTranslator
-from db.create_tables import comprehensive_analysis_table, metadata
+from db.create_tables import (
+    comprehensive_analysis_table,
+    data_migrations_table,
+    metadata,
+    model_outputs_table,
+    upgrade_existing_tables
+)
+from db.work_queue import (
+    AnalysisResultWriter,
+    claim_posts,
+    count_failed_posts,
+    count_pending_posts,
+    ensure_analysis_constraints,
+    get_checkpoint,
+    record_failures
+)
+from model_analysis.batching import map_with_fallback, run_batched, split_torch_threads
+from model_analysis.fake_news_detection.scoring import (
+    SCORING_VERSION,
+    calculate_content_reliability_score,
+    calculate_external_reliability_score,
+    calculate_global_reliability_score,
+    determine_confidence_level,
+    determine_final_category,
+    final_categories
+)
+from model_analysis.fake_news_detection.reliability_summary import (
+    ensure_reliability_summary,
+    read_reliability_summary,
+    rebuild_reliability_summary,
+    update_reliability_summary
+)
+from model_analysis.model_registry import get_model_revision, top_prediction
+from model_analysis.translation import translate, translate_texts
 
 load_dotenv()
 
-# Modèle RoBERTa pour classification multi-classes
-model_name = "cardiffnlp/twitter-roberta-base-sentiment-latest"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSequenceClassification.from_pretrained(model_name)
-classification_pipeline = pipeline("text-classification", model=model, tokenizer=tokenizer)
+# Modèle RoBERTa pour classification multi-classes (cardiffnlp/twitter-roberta-base-sentiment-latest)
+CLASSIFICATION_MODEL_KEY = "content_classification"
 
-# Modèle RoBERTa spécialisé pour la détection de fake news
-fake_news_model = "hamzab/roberta-fake-news-classification"
-fake_tokenizer = AutoTokenizer.from_pretrained(fake_news_model)
-fake_model = AutoModelForSequenceClassification.from_pretrained(fake_news_model)
-fake_news_pipeline = pipeline("text-classification", model=fake_model, tokenizer=fake_tokenizer)
+# Modèle RoBERTa spécialisé pour la détection de fake news (hamzab/roberta-fake-news-classification)
+FAKE_NEWS_MODEL_KEY = "fake_news"
 
 engine = get_engine()
-translator = GoogleTranslator(source='fr', target='en')
+
+# Conversion des labels du modèle vers nos catégories métier
+CATEGORY_MAPPING = {
+    'LABEL_0': 'Opinion négative',
+    'LABEL_1': 'Opinion neutre', 
+    'LABEL_2': 'Opinion positive',
+    'negative': 'Opinion négative',
+    'neutral': 'Information factuelle',
+    'positive': 'Opinion positive'
+}
+
+def classification_from_output(output):
+    """Catégorie métier et confiance à partir de la sortie brute du modèle de classification (None si échec)"""
+    if not output:
+        return "Indéterminé", 0.0
+    label, confidence = top_prediction(output)
+    return CATEGORY_MAPPING.get(label, 'Information générale'), confidence
+
+def fake_news_from_output(output):
+    """Détection (1 si fake) et confiance à partir de la sortie brute du modèle de fake news (None si échec)"""
+    if not output:
+        return 0, 0.0
+    label, confidence = top_prediction(output)
+    return (1 if label.upper() == "FAKE" else 0), confidence
+
+def run_model_outputs(model_key, translated_texts, batch_size=16, error_message="Erreur modèle"):
+    """
+    Sorties brutes d'un modèle sur des textes déjà traduits. Si le lot échoue, les textes sont
+    repris un par un (map_with_fallback) : seuls ceux qui échouent encore ont None comme sortie.
+    """
+    outputs, _ = map_with_fallback(lambda texts: run_batched(model_key, texts, batch_size), translated_texts, error_message)
+    return outputs
+
+def translate_each(texts):
+    """
+    Traduit les textes en un lot, puis un par un si le lot échoue (map_with_fallback) : None pour
+    les textes dont la traduction échoue encore.
+    """
+    translated_texts, _ = map_with_fallback(translate_texts, texts, "Erreur traduction")
+    return translated_texts
+
+def classify_contents(translated_texts, batch_size=16):
+    """Classifie des textes déjà traduits en catégories avec RoBERTa, dans l'ordre des textes"""
+    outputs = run_model_outputs(CLASSIFICATION_MODEL_KEY, translated_texts, batch_size, "Erreur classification contenu")
+    return [classification_from_output(output) for output in outputs]
+
+def detect_fake_news_batch(translated_texts, batch_size=16):
+    """Détecte les fake news avec RoBERTa sur des textes déjà traduits, dans l'ordre des textes"""
+    outputs = run_model_outputs(FAKE_NEWS_MODEL_KEY, translated_texts, batch_size, "Erreur détection fake news")
+    return [fake_news_from_output(output) for output in outputs]
+
+def run_content_models(texts, batch_size=16):
+    """
+    Traduit les textes une seule fois puis exécute la classification et la détection de fake news
+    en parallèle sur le même lot. Les threads d'inférence de torch sont partagés entre les deux modèles
+    pour ne pas dépasser le nombre de cœurs. Renvoie les sorties brutes (classification, fake news),
+    avec None pour les textes en échec (traduction ou modèle) ; les autres textes du lot sont analysés.
+    """
+    classification_outputs, fake_news_outputs = [None] * len(texts), [None] * len(texts)
+    translated = [(i, translated_text) for i, translated_text in enumerate(translate_each(texts)) if translated_text is not None]
+    if not translated:
+        return classification_outputs, fake_news_outputs
+    translated_texts = [translated_text for _, translated_text in translated]
+
+    with split_torch_threads(2), ThreadPoolExecutor(max_workers=2) as executor:
+        classification_future = executor.submit(
+            run_model_outputs, CLASSIFICATION_MODEL_KEY, translated_texts, batch_size, "Erreur classification contenu"
+        )
+        fake_news_future = executor.submit(
+            run_model_outputs, FAKE_NEWS_MODEL_KEY, translated_texts, batch_size, "Erreur détection fake news"
+        )
+        for (i, _), classification_output, fake_news_output in zip(translated, classification_future.result(), fake_news_future.result()):
+            classification_outputs[i] = classification_output
+            fake_news_outputs[i] = fake_news_output
+    return classification_outputs, fake_news_outputs
 
 def classify_content(text):
     """Classifie le contenu en catégories avec RoBERTa"""
     try:
-        translated_text = translator.translate(text)
-        result = classification_pipeline(translated_text)
-        
-        # Mapping des labels vers nos catégories
-        label = result[0]['label']
-        confidence = result[0]['score']
-        
-        # Conversion vers nos catégories métier
-        category_mapping = {
-            'LABEL_0': 'Opinion négative',
-            'LABEL_1': 'Opinion neutre', 
-            'LABEL_2': 'Opinion positive',
-            'negative': 'Opinion négative',
-            'neutral': 'Information factuelle',
-            'positive': 'Opinion positive'
-        }
-        
-        category = category_mapping.get(label, 'Information générale')
-        
-        return category, confidence
-        
+        translated_text = translate(text)
     except Exception as e:
         print(f"Erreur classification contenu: {e}")
         return "Indéterminé", 0.0
+    return classify_contents([translated_text])[0]
 
 def detect_fake_news(text):
     """Détecte les fake news avec RoBERTa"""
     try:
-        translated_text = translator.translate(text)
-        result = fake_news_pipeline(translated_text)
-        
-        prediction = result[0]
-        label = prediction['label'].upper()
-        confidence = prediction['score']
-        
-        is_fake = 1 if label == "FAKE" else 0
-        
-        return is_fake, confidence
-        
+        translated_text = translate(text)
     except Exception as e:
         print(f"Erreur détection fake news: {e}")
         return 0, 0.0
-
-def calculate_content_reliability_score(category, fake_confidence, content_confidence):
-    """Calcule le score de fiabilité basé sur le contenu"""
-    base_score = 50  # Score de base
-    
-    # Ajustement selon la catégorie
-    category_scores = {
-        'Information factuelle': 20,
-        'Information générale': 10,
-        'Opinion neutre': 5,
-        'Opinion positive': 0,
-        'Opinion négative': -5,
-        'Indéterminé': -10
-    }
-    
-    category_adjustment = category_scores.get(category, 0)
-    
-    # Ajustement selon la détection fake news
-    fake_adjustment = -30 if fake_confidence > 0.7 else 0
-    
-    # Ajustement selon la confiance dans la classification
-    confidence_adjustment = (content_confidence - 0.5) * 20
-    
-    score = base_score + category_adjustment + fake_adjustment + confidence_adjustment
-    return max(0, min(100, score))  # Limiter entre 0 et 100
+    return detect_fake_news_batch([translated_text])[0]
 
 def get_external_fact_check_data(post_id):
     """Récupère les données de fact-checking externes déjà collectées"""
-    with engine.connect() as connection:
-        # Récupérer les fact-checks depuis la table fact_checks
-        fact_checks = connection.execute(text("""
-            SELECT source_excerpt, source_site, source_link
-            FROM fact_checks_sources 
-            WHERE post_id = :post_id
-            ORDER BY id
-            LIMIT 1
-        """), {"post_id": post_id}).fetchone()
-        
-        if fact_checks:
-            return {
-                "rating": fact_checks.source_excerpt,
-                "source": fact_checks.source_site,
-                "url": fact_checks.source_link
-            }
-        return None
+    return get_external_fact_check_data_batch([post_id]).get(post_id)
 
-def calculate_external_reliability_score(fact_check_data):
-    """Calcule le score de fiabilité basé sur les sources externes"""
-    if not fact_check_data:
-        return 50  # Score neutre si pas de fact-check
-    
-    rating = fact_check_data.get("rating", "").lower()
-    
-    # Scores plus nuancés et précis
-    rating_scores = {
-        'vrai': 95, 'true': 95, 'vérifié': 95, 'correct': 95,
-        'plutôt vrai': 80, 'mostly true': 80, 'largement vrai': 80,
-        'en partie vrai': 65, 'partly true': 65, 'partiellement vrai': 65,
-        'c\'est plus compliqué': 50, 'mixed': 50, 'nuancé': 50,
-        'plutôt faux': 25, 'mostly false': 25, 'largement faux': 25,
-        'faux': 5, 'false': 5, 'fake': 5, 'mensonge': 5,
-        'trompeur': 15, 'misleading': 15, 'désinformation': 10
-    }
-    
-    for key, score in rating_scores.items():
-        if key in rating:
-            return score
-    
-    return 50  # Score par défaut
-
-def calculate_global_reliability_score(content_score, external_score, has_fact_check, fact_check_source=""):
-    """Calcule le score global de fiabilité avec pondération intelligente"""
-    if not has_fact_check:
-        return content_score
-    
-    # Sources très fiables (pondération 80% externe, 20% contenu)
-    high_trust_sources = ["franceinfo", "afp factuel", "liberation", "le monde", "reuters", "bbc"]
-    
-    # Sources moyennement fiables (pondération 60% externe, 40% contenu)
-    medium_trust_sources = ["tf1 info", "20 minutes", "figaro", "ouest-france"]
-    
-    source_lower = fact_check_source.lower()
-    
-    if any(trusted in source_lower for trusted in high_trust_sources):
-        # Priorité forte aux sources très fiables
-        return (external_score * 0.8) + (content_score * 0.2)
-    elif any(medium in source_lower for medium in medium_trust_sources):
-        # Pondération équilibrée pour sources moyennes
-        return (external_score * 0.6) + (content_score * 0.4)
-    else:
-        # Sources inconnues : équilibre 50/50
-        return (external_score * 0.5) + (content_score * 0.5)
-
-def determine_final_category(global_score, is_fake_news, fake_confidence, has_fact_check, external_score, fact_check_source=""):
+def get_external_fact_check_data_batch(post_ids, connection=None):
     """
-    Détermine la catégorie finale avec logique corrigée et seuils optimisés
-    Basé sur l'analyse d'évaluation qui montre une performance optimale au seuil 40
+    Récupère en une seule requête le premier fact-check déjà collecté de chaque post.
+    Renvoie {post_id: données du fact-check} ; les posts sans fact-check sont absents.
     """
-    
-    # Sources très fiables - priorité absolue
-    high_trust_sources = ["franceinfo", "afp factuel", "liberation", "le monde", "reuters", "bbc"]
-    source_lower = fact_check_source.lower()
-    
-    # 1. Si on a un fact-check de source très fiable, on lui fait confiance
-    if has_fact_check and any(trusted in source_lower for trusted in high_trust_sources):
-        if external_score >= 80:
-            return "Fiable"
-        elif external_score >= 60:
-            return "Plutôt fiable"
-        elif external_score <= 30:
-            return "Fake News"
-        else:
-            return "Douteux"
-    
-    # 2. Si l'IA détecte clairement du fake news avec haute confiance
-    if is_fake_news == 1 and fake_confidence > 0.8:
-        return "Fake News"
-    
-    # 3. Si l'IA dit que ce n'est PAS fake, on doit être cohérent
-    if is_fake_news == 0:
-        # Seuils optimisés basés sur l'évaluation (seuil optimal = 40)
-        if global_score >= 60:  # Abaissé de 70 à 60
-            return "Fiable"
-        elif global_score >= 40:  # Abaissé de 50 à 40 (seuil optimal)
-            return "Plutôt fiable"
-        elif global_score >= 25:  # Abaissé de 30 à 25
-            return "Douteux"
-        else:
-            return "Peu fiable"
-    
-    # 4. Cas où is_fake_news == 1 mais confiance faible
-    if is_fake_news == 1:
-        if fake_confidence > 0.6:
-            return "Fake News"
-        elif global_score < 30:  # Abaissé de 40 à 30
-            return "Peu fiable"
-        else:
-            return "Douteux"
-    
-    # 5. Cas par défaut : seuils optimisés pour le score global
-    if global_score >= 70:      # Abaissé de 80 à 70
-        return "Fiable"
-    elif global_score >= 50:    # Abaissé de 60 à 50
-        return "Plutôt fiable"
-    elif global_score >= 40:    # Seuil optimal identifié
-        return "Douteux"
-    elif global_score >= 20:    # Inchangé
-        return "Peu fiable"
-    else:
-        return "Non fiable"
+    if not post_ids:
+        return {}
+    if connection is None:
+        with engine.connect() as connection:
+            return get_external_fact_check_data_batch(post_ids, connection)
 
-def determine_confidence_level(content_conf, fake_conf, has_fact_check):
-    """Détermine le niveau de confiance"""
-    avg_conf = (content_conf + fake_conf) / 2
-    
-    if has_fact_check and avg_conf > 0.8:
-        return "Très élevée"
-    elif avg_conf > 0.7:
-        return "Élevée"
-    elif avg_conf > 0.5:
-        return "Moyenne"
-    else:
-        return "Faible"
+    # DISTINCT ON garde la première ligne de chaque post dans l'ordre du ORDER BY (plus petit id)
+    fact_checks = connection.execute(text("""
+        SELECT DISTINCT ON (post_id) post_id, source_excerpt, source_site, source_link
+        FROM fact_checks_sources
+        WHERE post_id = ANY(:post_ids)
+        ORDER BY post_id, id
+    """), {"post_ids": list(post_ids)}).fetchall()
+    return {
+        fact_check.post_id: {
+            "rating": fact_check.source_excerpt,
+            "source": fact_check.source_site,
+            "url": fact_check.source_link
+        }
+        for fact_check in fact_checks
+    }
 
 def comprehensive_analysis(text, post_id):
-    """Analyse complète d'un texte en utilisant les fact-checks existants"""
-    
-    # 1. Classification du contenu
-    category, content_confidence = classify_content(text)
-    
-    # 2. Détection fake news
-    is_fake, fake_confidence = detect_fake_news(text)
+    """Analyse complète d'un texte en utilisant les fact-checks existants (None si un modèle a échoué)"""
+    return comprehensive_analysis_batch([(post_id, text)])[0]
+
+def score_analysis(post_id, classification_output, fake_news_output, fact_check_data):
+    """
+    Calcule toutes les colonnes dérivées d'une analyse à partir des sorties brutes des deux modèles
+    et du fact-check du post, selon les règles de la version SCORING_VERSION
+    """
+    # 1. et 2. Catégorie du contenu et détection fake news
+    category, content_confidence = classification_from_output(classification_output)
+    is_fake, fake_confidence = fake_news_from_output(fake_news_output)
     
     # 3. Score de fiabilité du contenu
     content_score = calculate_content_reliability_score(category, fake_confidence, content_confidence)
     
-    # 4. Récupérer les fact-checks existants (au lieu de les rechercher)
-    fact_check_data = get_external_fact_check_data(post_id)
+    # 4. Fact-checks existants
     has_fact_check = fact_check_data is not None
     external_score = calculate_external_reliability_score(fact_check_data)
     
@@ -272,155 +221,461 @@ def comprehensive_analysis(text, post_id):
         "external_reliability_score": round(external_score, 2),
         "global_reliability_score": round(global_score, 2),
         "final_category": final_category,
-        "confidence_level": confidence_level
+        "confidence_level": confidence_level,
+        "scoring_version": SCORING_VERSION
     }
 
-def analyze_posts_comprehensive():
-    """Analyse complète de tous les posts non traités"""
+def comprehensive_analysis_batch(posts, batch_size=16):
+    """
+    Analyse complète d'une liste de (post_id, texte) : une traduction par texte, puis les deux
+    modèles exécutés en parallèle sur tout le lot. Les résultats sont dans l'ordre des posts,
+    avec None pour les posts dont une sortie de modèle manque.
+    """
+    return [result[0] if result else None for result in comprehensive_analysis_with_outputs(posts, batch_size)]
+
+def comprehensive_analysis_with_outputs(posts, batch_size=16, fact_checks=None):
+    """
+    Comme comprehensive_analysis_batch, avec en plus pour chaque post les lignes de sorties brutes
+    à enregistrer dans model_outputs : renvoie une liste de (analyse, lignes de sorties brutes).
+    Un post dont la traduction ou l'un des deux modèles a échoué n'est pas noté (None à sa place) :
+    une analyse sans sorties brutes ne pourrait pas être recalculée par rescore_analyses.
+    `fact_checks` ({post_id: fact-check}, voir get_external_fact_check_data_batch) est chargé
+    en une requête pour tout le lot s'il n'est pas fourni.
+    """
+    if fact_checks is None:
+        fact_checks = get_external_fact_check_data_batch([post_id for post_id, _ in posts])
+    classification_outputs, fake_news_outputs = run_content_models([full_text for _, full_text in posts], batch_size)
+    
+    results = []
+    for (post_id, _), classification_output, fake_news_output in zip(posts, classification_outputs, fake_news_outputs):
+        if classification_output is None or fake_news_output is None:
+            results.append(None)
+            continue
+        analysis_data = score_analysis(post_id, classification_output, fake_news_output, fact_checks.get(post_id))
+        output_rows = [
+            {
+                "post_id": post_id,
+                "model_key": model_key,
+                "model_revision": get_model_revision(model_key),
+                "outputs": output
+            }
+            for model_key, output in ((CLASSIFICATION_MODEL_KEY, classification_output), (FAKE_NEWS_MODEL_KEY, fake_news_output))
+        ]
+        results.append((analysis_data, output_rows))
+    return results
+
+ANALYSIS_NAME = "comprehensive"
+
+def new_result_writer():
+    return AnalysisResultWriter(engine, ANALYSIS_NAME, comprehensive_analysis_table, on_write=update_reliability_summary)
+
+def analyze_post_chunk(post_ids, batch_size=16, verbose=True, writer=None):
+    """
+    Analyse un bloc de posts réservés et confie les résultats et les sorties brutes des modèles
+    à `writer` (AnalysisResultWriter), qui les écrit par lots sans doublon et libère les baux
+    des posts écrits. Sans writer, un writer propre au bloc est vidé à la fin de l'analyse.
+    Les posts dont un modèle a échoué ne sont pas écrits et gardent leur bail : ils sont comptés
+    en échec et seront réservés de nouveau à l'expiration du bail, jusqu'à ANALYSIS_MAX_ATTEMPTS fois.
+    Renvoie (nombre de posts analysés, liste de (post_id, erreur)) ; sans writer, le nombre est
+    celui des posts écrits et les erreurs d'écriture sont comprises dans la liste.
+    """
+    if writer is None:
+        with new_result_writer() as writer:
+            _, failures = analyze_post_chunk(post_ids, batch_size, verbose, writer)
+        return writer.rows_written, failures + writer.failures
+
     with engine.connect() as connection:
-        # Sélectionner seulement les posts qui n'ont pas encore été analysés
-        posts_table = connection.execute(text("""
-            SELECT p.id, p.title, p.content 
-            FROM posts p
-            LEFT JOIN comprehensive_reliability_analysis cra 
-            ON p.id = cra.post_id
-            WHERE cra.post_id IS NULL
-            ORDER BY p.id
-        """)).fetchall()
-
-        print(f"Nombre de posts à analyser: {len(posts_table)}")
-
-        for post in posts_table:
-            post_id, title, content = post
-            try:
-                # Combiner titre et contenu
-                full_text = f"{title} {content}" if title and title != "None" else content
-                
-                print(f"\n--- Analyse du post ID {post_id} ---")
-                analysis_data = comprehensive_analysis(full_text, post_id)
-                
-                connection.execute(comprehensive_analysis_table.insert(), analysis_data)
-                connection.commit()
-                
-                print(f"✅ Catégorie: {analysis_data['final_category']}")
-                print(f"   Score global: {analysis_data['global_reliability_score']:.1f}%")
-                print(f"   IA détecte fake: {'Oui' if analysis_data['is_fake_news'] else 'Non'}")
-                print(f"   Confiance: {analysis_data['confidence_level']}")
-                print(f"   Fact-check externe: {'Oui' if analysis_data['has_fact_check'] else 'Non'}")
-                
-            except Exception as e:
-                print(f"❌ Erreur pour le post ID {post_id}: {e}")
-                continue
-
-def fix_existing_inconsistencies():
-    """Corrige les incohérences dans les données existantes"""
-    print("\n🔧 CORRECTION DES INCOHÉRENCES EXISTANTES")
+        chunk = connection.execute(text("""
+            SELECT id, title, content FROM posts WHERE id = ANY(:post_ids) ORDER BY id
+        """), {"post_ids": list(post_ids)}).fetchall()
+        if not chunk:
+            return 0, []
+
+        # Combiner titre et contenu
+        chunk_texts = [
+            (post_id, f"{title} {content}" if title and title != "None" else content or "")
+            for post_id, title, content in chunk
+        ]
+        fact_checks = get_external_fact_check_data_batch([post_id for post_id, _ in chunk_texts], connection)
+
+    try:
+        chunk_results = comprehensive_analysis_with_outputs(chunk_texts, batch_size, fact_checks)
+    except Exception as e:
+        print(f"❌ Erreur pour les posts ID {chunk[0][0]} à {chunk[-1][0]}: {e}")
+        return 0, [(post_id, str(e)) for post_id, _ in chunk_texts]
+
+    failures = []
+    for (post_id, _), result in zip(chunk_texts, chunk_results):
+        if result is None:
+            print(f"❌ Post ID {post_id}: sorties des modèles manquantes, analyse non enregistrée")
+            failures.append((post_id, "Sorties des modèles manquantes"))
+            continue
+        analysis_data, output_rows = result
+        writer.add(analysis_data, [(model_outputs_table, output_row) for output_row in output_rows])
+        
+        if verbose:
+            print(f"✅ Post ID {analysis_data['post_id']} - Catégorie: {analysis_data['final_category']}")
+            print(f"   Score global: {analysis_data['global_reliability_score']:.1f}%")
+            print(f"   IA détecte fake: {'Oui' if analysis_data['is_fake_news'] else 'Non'}")
+            print(f"   Confiance: {analysis_data['confidence_level']}")
+            print(f"   Fact-check externe: {'Oui' if analysis_data['has_fact_check'] else 'Non'}")
+    return len(chunk_results) - len(failures), failures
+
+def init_analysis_worker(torch_threads):
+    """Initialisation d'un processus d'analyse : nombre de threads torch fixé pour ne pas surcharger les cœurs"""
+    import torch
+
+    torch.set_num_threads(torch_threads)
+
+def analyze_posts_comprehensive(batch_size=16, chunk_size=64, workers=1, lease_seconds=900):
+    """
+    Analyse complète de tous les posts non traités, par blocs de chunk_size posts.
+    Chaque bloc est réservé avec un bail (SELECT ... FOR NO KEY UPDATE SKIP LOCKED) : plusieurs copies
+    de cette fonction, sur une ou plusieurs machines, peuvent tourner en même temps sans analyser
+    deux fois le même post.
+    Avec workers > 1, les blocs sont répartis entre plusieurs processus : chacun charge les modèles
+    une seule fois et écrit ses résultats lui-même, le processus parent suit l'avancement et les échecs.
+    Les résultats sont écrits par lots (voir AnalysisResultWriter) avec un point d'avancement
+    dans analysis_checkpoints. Les posts en échec sont repris à l'expiration de leur bail, puis
+    abandonnés après ANALYSIS_MAX_ATTEMPTS réservations (voir record_failures).
+    """
+    print(f"Nombre de posts à analyser: {count_pending_posts(engine, ANALYSIS_NAME)}")
+    if checkpoint := get_checkpoint(engine, ANALYSIS_NAME):
+        print(f"Dernier point d'avancement: {checkpoint.rows_written} résultat(s) écrit(s), "
+              f"jusqu'au post ID {checkpoint.last_post_id} ({checkpoint.updated_at})")
+    failures = []
+    nb_written = 0
+
+    def claim_chunk():
+        return claim_posts(engine, ANALYSIS_NAME, chunk_size, lease_seconds)
+
+    if workers <= 1:
+        with new_result_writer() as writer:
+            while chunk := claim_chunk():
+                print(f"\n--- Analyse des posts ID {chunk[0]} à {chunk[-1]} ---")
+                _, chunk_failures = analyze_post_chunk(chunk, batch_size, writer=writer)
+                record_failures(engine, ANALYSIS_NAME, chunk_failures)
+                failures.extend(chunk_failures)
+        nb_written += writer.rows_written
+        record_failures(engine, ANALYSIS_NAME, writer.failures)
+        failures.extend(writer.failures)
+    else:
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"Analyse répartie sur {workers} processus ({torch_threads} thread(s) torch chacun)")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_analysis_worker,
+            initargs=(torch_threads,)
+        ) as executor:
+            # Deux blocs réservés par processus au plus, pour ne pas garder de baux sur des posts en attente
+            futures = {}
+            while len(futures) < 2 * workers and (chunk := claim_chunk()):
+                futures[executor.submit(analyze_post_chunk, chunk, batch_size, False)] = chunk
+
+            nb_done = 0
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = futures.pop(future)
+                    try:
+                        chunk_written, chunk_failures = future.result()
+                    except Exception as e:
+                        chunk_written, chunk_failures = 0, [(post_id, str(e)) for post_id in chunk]
+                    nb_written += chunk_written
+                    record_failures(engine, ANALYSIS_NAME, chunk_failures)
+                    failures.extend(chunk_failures)
+                    nb_done += 1
+                    print(f"📦 Bloc {nb_done} terminé (posts ID {chunk[0]} à {chunk[-1]}) - "
+                          f"{nb_written} post(s) analysé(s), {len(failures)} échec(s)")
+
+                    if next_chunk := claim_chunk():
+                        futures[executor.submit(analyze_post_chunk, next_chunk, batch_size, False)] = next_chunk
+
+    print(f"\n✅ {nb_written} post(s) analysé(s), {len(failures)} échec(s)")
+    for post_id, error in failures[:10]:
+        print(f"   ❌ Post ID {post_id}: {error}")
+    if nb_failed := count_failed_posts(engine, ANALYSIS_NAME):
+        print(f"⛔ {nb_failed} post(s) abandonné(s) au total (voir last_error dans analysis_leases)")
+    return nb_written, failures
+
+# Colonnes recalculées par rescore_analyses (tout sauf post_id)
+RESCORED_COLUMNS = [
+    "content_category", "content_confidence", "is_fake_news", "fake_news_confidence",
+    "content_reliability_score", "has_fact_check", "fact_check_rating", "fact_check_source",
+    "external_reliability_score", "global_reliability_score", "final_category", "confidence_level",
+    "scoring_version"
+]
+
+def rescore_analyses(chunk_size=1000, stale_only=False):
+    """
+    Recalcule toutes les colonnes dérivées des analyses existantes à partir des sorties brutes
+    enregistrées dans model_outputs (dernière révision de chaque modèle) et des fact-checks actuels,
+    selon les règles de la version SCORING_VERSION. Aucun modèle n'est chargé.
+    Avec stale_only=True, seules les analyses d'une autre version des règles sont recalculées.
+    Les analyses sans sorties brutes (antérieures à leur enregistrement, ou écrites avec des sorties
+    manquantes) sont laissées telles quelles : voir reset_analyses_without_outputs.
+    """
+    print(f"\n🔁 RECALCUL DES SCORES (version {SCORING_VERSION})")
     print("-" * 50)
-    
+
+    update_statement = (
+        update(comprehensive_analysis_table)
+        .where(comprehensive_analysis_table.c.id == bindparam("analysis_id"))
+        .values({column: bindparam(f"new_{column}") for column in RESCORED_COLUMNS})
+    )
+
+    nb_rescored = 0
+    nb_without_outputs = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            analyses = connection.execute(text("""
+                SELECT cra.id, cra.post_id,
+                       classification.outputs AS classification_output,
+                       fake_news.outputs AS fake_news_output
+                FROM comprehensive_reliability_analysis cra
+                LEFT JOIN LATERAL (
+                    SELECT outputs FROM model_outputs
+                    WHERE post_id = cra.post_id AND model_key = :classification_key
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT 1
+                ) classification ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT outputs FROM model_outputs
+                    WHERE post_id = cra.post_id AND model_key = :fake_news_key
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT 1
+                ) fake_news ON TRUE
+                WHERE cra.id > :last_id
+                AND (NOT :stale_only OR cra.scoring_version IS DISTINCT FROM :scoring_version)
+                ORDER BY cra.id
+                LIMIT :chunk_size
+            """), {
+                "classification_key": CLASSIFICATION_MODEL_KEY,
+                "fake_news_key": FAKE_NEWS_MODEL_KEY,
+                "stale_only": stale_only,
+                "scoring_version": SCORING_VERSION,
+                "last_id": last_id,
+                "chunk_size": chunk_size
+            }).fetchall()
+            if not analyses:
+                break
+            last_id = analyses[-1].id
+
+            fact_checks = get_external_fact_check_data_batch([analysis.post_id for analysis in analyses], connection)
+            updates = []
+            for analysis in analyses:
+                if analysis.classification_output is None or analysis.fake_news_output is None:
+                    nb_without_outputs += 1
+                    continue
+                analysis_data = score_analysis(analysis.post_id, analysis.classification_output,
+                                               analysis.fake_news_output, fact_checks.get(analysis.post_id))
+                updates.append({
+                    "analysis_id": analysis.id,
+                    **{f"new_{column}": analysis_data[column] for column in RESCORED_COLUMNS}
+                })
+            if updates:
+                connection.execute(update_statement, updates)
+            nb_rescored += len(updates)
+        print(f"   {nb_rescored} analyse(s) recalculée(s)")
+
+    print(f"\n🔁 {nb_rescored} analyse(s) recalculée(s), {nb_without_outputs} sans sorties brutes enregistrées")
+    if nb_rescored:
+        rebuild_reliability_summary()
+    return nb_rescored
+
+def reset_analyses_without_outputs(chunk_size=1000):
+    """
+    Supprime les analyses auxquelles il manque la sortie brute d'un des deux modèles (notées avec
+    des valeurs par défaut, ou antérieures à model_outputs) : rescore_analyses ne peut pas les
+    recalculer. Les posts concernés redeviennent à analyser et repasseront par les modèles.
+    """
+    print("\n🧹 SUPPRESSION DES ANALYSES SANS SORTIES BRUTES")
+    print("-" * 50)
+
+    nb_deleted = 0
+    while True:
+        with engine.begin() as connection:
+            deleted = connection.execute(text("""
+                DELETE FROM comprehensive_reliability_analysis
+                WHERE id IN (
+                    SELECT cra.id
+                    FROM comprehensive_reliability_analysis cra
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM model_outputs mo
+                        WHERE mo.post_id = cra.post_id AND mo.model_key = :classification_key
+                    )
+                    OR NOT EXISTS (
+                        SELECT 1 FROM model_outputs mo
+                        WHERE mo.post_id = cra.post_id AND mo.model_key = :fake_news_key
+                    )
+                    LIMIT :chunk_size
+                )
+            """), {
+                "classification_key": CLASSIFICATION_MODEL_KEY,
+                "fake_news_key": FAKE_NEWS_MODEL_KEY,
+                "chunk_size": chunk_size
+            }).rowcount
+        nb_deleted += deleted
+        if deleted < chunk_size:
+            break
+        print(f"   {nb_deleted} analyse(s) supprimée(s)")
+
+    print(f"🧹 {nb_deleted} analyse(s) sans sorties brutes supprimée(s), à analyser de nouveau")
+    if nb_deleted:
+        rebuild_reliability_summary()
+    return nb_deleted
+
+def fix_existing_inconsistencies(chunk_size=5000):
+    """
+    Met à jour les analyses écrites avec une version antérieure des règles (scoring_version différente
+    de SCORING_VERSION) :
+    - celles dont les sorties brutes des modèles sont enregistrées sont entièrement recalculées et
+      passent à SCORING_VERSION (voir rescore_analyses) ;
+    - pour les autres, seules les confiances arrondies sont stockées : comme avant, seule la catégorie
+      finale est recalculée à partir des scores stockés, et scoring_version n'est pas modifiée.
+    Un passage complet est enregistré dans data_migrations pour la version courante : tant que
+    SCORING_VERSION ne change pas, les analyses ne sont pas relues (les nouvelles analyses sont
+    écrites directement à la version courante).
+    """
+    migration_name = f"fix_existing_inconsistencies_v{SCORING_VERSION}"
     with engine.connect() as connection:
-        # Récupérer toutes les analyses existantes
-        analyses = connection.execute(text("""
-            SELECT id, post_id, global_reliability_score, is_fake_news, 
-                   fake_news_confidence, has_fact_check, external_reliability_score,
-                   fact_check_source, final_category
-            FROM comprehensive_reliability_analysis
-        """)).fetchall()
-        
-        corrections_made = 0
-        
-        for analysis in analyses:
-            # Recalculer la catégorie avec la logique corrigée
-            new_category = determine_final_category(
-                analysis.global_reliability_score,
-                analysis.is_fake_news,
-                analysis.fake_news_confidence,
-                analysis.has_fact_check,
-                analysis.external_reliability_score,
-                analysis.fact_check_source or ""
+        already_applied = connection.execute(
+            select(data_migrations_table.c.name).where(data_migrations_table.c.name == migration_name)
+        ).first() is not None
+    if already_applied:
+        print(f"\n🔧 Analyses déjà à jour (version {SCORING_VERSION})")
+        return
+
+    print("\n🔧 CORRECTION DES INCOHÉRENCES EXISTANTES")
+    print("-" * 50)
+
+    # 1. Analyses avec sorties brutes : recalcul complet à la version courante
+    rescore_analyses(stale_only=True)
+
+    # 2. Analyses sans sorties brutes : catégorie finale seule, à partir des scores stockés
+    category_changes = Counter()
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            result = connection.execute(text("""
+                SELECT id, global_reliability_score, is_fake_news, fake_news_confidence,
+                       has_fact_check, external_reliability_score, fact_check_source, final_category
+                FROM comprehensive_reliability_analysis
+                WHERE id > :last_id AND scoring_version IS DISTINCT FROM :scoring_version
+                ORDER BY id
+                LIMIT :chunk_size
+            """), {"last_id": last_id, "scoring_version": SCORING_VERSION, "chunk_size": chunk_size})
+            analyses = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+            if analyses.empty:
+                break
+            last_id = int(analyses["id"].iloc[-1])
+
+            new_categories = final_categories(
+                analyses["global_reliability_score"].fillna(0), analyses["is_fake_news"], analyses["fake_news_confidence"].fillna(0),
+                analyses["has_fact_check"].fillna(False).astype(bool), analyses["external_reliability_score"].fillna(0),
+                analyses["fact_check_source"].fillna("")
             )
-            
-            # Si différent, mettre à jour
-            if new_category != analysis.final_category:
-                connection.execute(text("""
-                    UPDATE comprehensive_reliability_analysis 
-                    SET final_category = :new_category
-                    WHERE id = :analysis_id
-                """), {
-                    "new_category": new_category,
-                    "analysis_id": analysis.id
-                })
-                
-                print(f"✅ Post #{analysis.post_id}: '{analysis.final_category}' → '{new_category}'")
-                corrections_made += 1
-        
-        connection.commit()
-        print(f"\n🔧 {corrections_made} corrections appliquées")
+            changed = analyses["final_category"].to_numpy() != new_categories
+            if changed.any():
+                params = {}
+                rows_sql = []
+                for i, (analysis_id, new_category) in enumerate(zip(analyses["id"][changed], new_categories[changed])):
+                    rows_sql.append(f"(:id_{i}, :final_category_{i})")
+                    params.update({f"id_{i}": int(analysis_id), f"final_category_{i}": new_category})
+                connection.execute(text(f"""
+                    UPDATE comprehensive_reliability_analysis AS cra
+                    SET final_category = v.final_category
+                    FROM (VALUES {", ".join(rows_sql)}) AS v(id, final_category)
+                    WHERE cra.id = v.id
+                """), params)
+                category_changes.update(zip(analyses["final_category"][changed], new_categories[changed]))
+
+    for (old_category, new_category), count in category_changes.most_common():
+        print(f"✅ '{old_category}' → '{new_category}': {count} post(s)")
+    print(f"\n🔧 {sum(category_changes.values())} corrections de catégorie appliquées aux analyses sans sorties brutes")
+
+    with engine.begin() as connection:
+        connection.execute(pg_insert(data_migrations_table).values(name=migration_name).on_conflict_do_nothing())
+    if category_changes:
+        rebuild_reliability_summary()
 
 def generate_synthetic_report():
-    """Génère un rapport synthétique des analyses"""
-    with engine.connect() as connection:
-        # Statistiques générales
-        stats = connection.execute(text("""
-            SELECT 
-                COUNT(*) as total_posts,
-                AVG(global_reliability_score) as avg_reliability,
-                COUNT(CASE WHEN final_category = 'Fake News' THEN 1 END) as fake_news_count,
-                COUNT(CASE WHEN final_category = 'Fiable' THEN 1 END) as reliable_count,
-                COUNT(CASE WHEN has_fact_check = true THEN 1 END) as fact_checked_count,
-                COUNT(CASE WHEN is_fake_news = 1 AND final_category = 'Fake News' THEN 1 END) as consistent_fake,
-                COUNT(CASE WHEN is_fake_news = 0 AND final_category != 'Fake News' THEN 1 END) as consistent_real
-            FROM comprehensive_reliability_analysis
-        """)).fetchone()
+    """
+    Génère un rapport synthétique des analyses, à partir du résumé tenu à jour à chaque écriture
+    (tables reliability_summary et reliability_lowest_scores) : temps constant quel que soit
+    le nombre d'analyses
+    """
+    categories, problematic = read_reliability_summary(limit=5)
+    total_posts = sum(cat.post_count for cat in categories)
+    
+    if total_posts > 0:
+        by_category = {cat.final_category: cat for cat in categories}
+        fake_news = by_category.get("Fake News")
+        reliable = by_category.get("Fiable")
+        fake_news_count = fake_news.post_count if fake_news else 0
+        reliable_count = reliable.post_count if reliable else 0
+        fact_checked_count = sum(cat.fact_checked_count for cat in categories)
+        avg_reliability = sum(cat.score_sum for cat in categories) / total_posts
+        consistent_fake = fake_news.fake_detected_count if fake_news else 0
+        consistent_real = sum(cat.real_detected_count for cat in categories if cat.final_category != "Fake News")
         
-        if stats and stats.total_posts > 0:
-            print("\n" + "="*60)
-            print("           RAPPORT SYNTHÉTIQUE DE FIABILITÉ")
-            print("="*60)
-            
-            print(f"\n📊 STATISTIQUES GÉNÉRALES:")
-            print(f"   • Total posts analysés: {stats.total_posts}")
-            print(f"   • Score de fiabilité moyen: {stats.avg_reliability:.1f}%")
-            print(f"   • Posts fact-checkés: {stats.fact_checked_count} ({stats.fact_checked_count/stats.total_posts*100:.1f}%)")
-            
-            # Vérification de cohérence
-            consistency_rate = ((stats.consistent_fake + stats.consistent_real) / stats.total_posts) * 100
-            print(f"   • Cohérence IA/Catégorie: {consistency_rate:.1f}%")
-            
-            print(f"\n🎯 RÉPARTITION PAR CATÉGORIE:")
-            print(f"   • Fake News détectées: {stats.fake_news_count}")
-            print(f"   • Informations fiables: {stats.reliable_count}")
-            print(f"   • Autres catégories: {stats.total_posts - stats.fake_news_count - stats.reliable_count}")
-            
-            # Distribution par catégorie
-            categories = connection.execute(text("""
-                SELECT final_category, COUNT(*) as count,
-                       AVG(global_reliability_score) as avg_score
-                FROM comprehensive_reliability_analysis
-                GROUP BY final_category
-                ORDER BY count DESC
-            """)).fetchall()
-            
-            print(f"\n📈 DÉTAIL PAR CATÉGORIE:")
-            for cat in categories:
-                print(f"   • {cat.final_category}: {cat.count} posts (score moyen: {cat.avg_score:.1f}%)")
-            
-            # Posts les plus problématiques
-            print(f"\n⚠️  TOP 5 POSTS LES PLUS PROBLÉMATIQUES:")
-            problematic = connection.execute(text("""
-                SELECT p.title, cra.global_reliability_score, cra.final_category, cra.is_fake_news
-                FROM comprehensive_reliability_analysis cra
-                JOIN posts p ON cra.post_id = p.id
-                WHERE cra.global_reliability_score < 50
-                ORDER BY cra.global_reliability_score ASC
-                LIMIT 5
-            """)).fetchall()
-            
-            for i, post in enumerate(problematic, 1):
-                title = post.title if post.title != "None" else "Sans titre"
-                fake_status = "IA: Fake" if post.is_fake_news else "IA: Real"
-                print(f"   {i}. {title[:50]}... ({post.final_category}: {post.global_reliability_score:.1f}%, {fake_status})")
-            
-            print("\n" + "="*60)
+        print("\n" + "="*60)
+        print("           RAPPORT SYNTHÉTIQUE DE FIABILITÉ")
+        print("="*60)
+        
+        print(f"\n📊 STATISTIQUES GÉNÉRALES:")
+        print(f"   • Total posts analysés: {total_posts}")
+        print(f"   • Score de fiabilité moyen: {avg_reliability:.1f}%")
+        print(f"   • Posts fact-checkés: {fact_checked_count} ({fact_checked_count/total_posts*100:.1f}%)")
+        
+        # Vérification de cohérence
+        consistency_rate = ((consistent_fake + consistent_real) / total_posts) * 100
+        print(f"   • Cohérence IA/Catégorie: {consistency_rate:.1f}%")
+        
+        print(f"\n🎯 RÉPARTITION PAR CATÉGORIE:")
+        print(f"   • Fake News détectées: {fake_news_count}")
+        print(f"   • Informations fiables: {reliable_count}")
+        print(f"   • Autres catégories: {total_posts - fake_news_count - reliable_count}")
+        
+        # Distribution par catégorie
+        print(f"\n📈 DÉTAIL PAR CATÉGORIE:")
+        for cat in categories:
+            if cat.post_count:
+                print(f"   • {cat.final_category}: {cat.post_count} posts (score moyen: {cat.score_sum / cat.post_count:.1f}%)")
+        
+        # Posts les plus problématiques
+        print(f"\n⚠️  TOP 5 POSTS LES PLUS PROBLÉMATIQUES:")
+        for i, post in enumerate(problematic, 1):
+            title = post.title if post.title and post.title != "None" else "Sans titre"
+            fake_status = "IA: Fake" if post.is_fake_news else "IA: Real"
+            print(f"   {i}. {title[:50]}... ({post.final_category}: {post.global_reliability_score:.1f}%, {fake_status})")
+        
+        print("\n" + "="*60)
+
+def store_analysis(connection, analysis_data, output_rows=()):
+    """
+    Enregistre une analyse hors du circuit des workers (sans doublon) avec les sorties brutes des
+    modèles, et l'ajoute au résumé si elle a été insérée. Le commit est laissé à l'appelant.
+    Une analyse sans les sorties brutes des deux modèles est refusée (ValueError).
+    """
+    missing_models = {CLASSIFICATION_MODEL_KEY, FAKE_NEWS_MODEL_KEY} - {
+        output_row["model_key"] for output_row in output_rows if output_row.get("outputs") is not None
+    }
+    if missing_models:
+        raise ValueError(f"Sorties brutes manquantes pour le post ID {analysis_data['post_id']}: {', '.join(sorted(missing_models))}")
+    if output_rows:
+        connection.execute(pg_insert(model_outputs_table).values(list(output_rows)).on_conflict_do_nothing())
+    inserted = connection.execute(
+        pg_insert(comprehensive_analysis_table)
+        .values(analysis_data)
+        .on_conflict_do_nothing(index_elements=["post_id"])
+        .returning(comprehensive_analysis_table.c.post_id)
+    ).fetchone()
+    if inserted:
+        update_reliability_summary(connection, [analysis_data])
+    return inserted is not None
 
 def analyze_specific_post(post_id):
     """Analyse un post spécifique pour la détection de fake news"""
@@ -448,10 +703,14 @@ def analyze_specific_post(post_id):
         
         # Analyser le post
         full_text = f"{post.title} {post.content}" if post.title and post.title != "None" else post.content
-        analysis_data = comprehensive_analysis(full_text, post_id)
+        result = comprehensive_analysis_with_outputs([(post_id, full_text)])[0]
+        if result is None:
+            print(f"❌ Analyse impossible pour le post ID {post_id}: sorties des modèles manquantes")
+            return
+        analysis_data, output_rows = result
         
-        # Sauvegarder le résultat
-        connection.execute(comprehensive_analysis_table.insert(), analysis_data)
+        # Sauvegarder le résultat et les sorties brutes des modèles
+        store_analysis(connection, analysis_data, output_rows)
         connection.commit()
         
         print(f"Analyse terminée pour le post ID {post_id}")
@@ -465,7 +724,23 @@ if __name__ == "__main__":
     # Créer la table si elle n'existe pas
     print("\n📋 Vérification/création des tables...")
     metadata.create_all(engine)
+    upgrade_existing_tables(engine)
+    ensure_analysis_constraints(engine)
+    ensure_reliability_summary(engine)
     print("✅ Tables prêtes")
+
+    # Usage : python -m model_analysis.fake_news_detection.fake_news_detection_roberta rescore
+    # pour recalculer les scores des analyses existantes sans relancer les modèles
+    if len(sys.argv) > 1 and sys.argv[1] == "rescore":
+        rescore_analyses()
+        generate_synthetic_report()
+        sys.exit(0)
+
+    # Usage : python -m model_analysis.fake_news_detection.fake_news_detection_roberta reset-missing-outputs
+    # pour supprimer les analyses sans sorties brutes, qui seront refaites par la prochaine analyse
+    if len(sys.argv) > 1 and sys.argv[1] == "reset-missing-outputs":
+        reset_analyses_without_outputs()
+        sys.exit(0)
     
     # Message d'information sur la complémentarité
     print("\n💡 Ce script utilise les fact-checks déjà collectés par get_fact_checking_datas.py")
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db.db_connection import get_engine
+from db.create_tables import data_migrations_table, reliability_lowest_scores_table, reliability_summary_table
+
+# Nombre d'analyses les plus mal notées conservées dans reliability_lowest_scores
+TOP_K = 100
+# Seuil de score global en dessous duquel une analyse est considérée comme problématique
+PROBLEMATIC_SCORE = 50
+# Groupe du résumé des analyses sans catégorie finale (final_category NULL), distinct de toute
+# catégorie réelle ; comme dans l'ancien rapport, elles ne comptent pas parmi les "real" cohérents
+UNKNOWN_CATEGORY = "Sans catégorie"
+# Version du calcul du résumé : un résumé construit par une version antérieure est recalculé au démarrage
+SUMMARY_VERSION = 2
+
+engine = get_engine()
+
+def lock_summary(connection):
+    """Sérialise les mises à jour du résumé entre workers, jusqu'à la fin de la transaction."""
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('reliability_summary'))"))
+
+def update_reliability_summary(connection, analyses):
+    """
+    Ajoute au résumé des analyses nouvellement insérées (dictionnaires de colonnes de
+    comprehensive_reliability_analysis), dans la transaction de leur insertion.
+    """
+    if not analyses:
+        return
+
+    totals = defaultdict(lambda: {"post_count": 0, "score_sum": 0.0, "fact_checked_count": 0,
+                                  "fake_detected_count": 0, "real_detected_count": 0})
+    for analysis in analyses:
+        category_totals = totals[analysis["final_category"] or UNKNOWN_CATEGORY]
+        category_totals["post_count"] += 1
+        category_totals["score_sum"] += analysis["global_reliability_score"] or 0.0
+        category_totals["fact_checked_count"] += 1 if analysis["has_fact_check"] else 0
+        category_totals["fake_detected_count"] += 1 if analysis["is_fake_news"] == 1 else 0
+        category_totals["real_detected_count"] += 1 if analysis["is_fake_news"] == 0 and analysis["final_category"] is not None else 0
+
+    lock_summary(connection)
+    statement = pg_insert(reliability_summary_table)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=["final_category"],
+            set_={
+                column: reliability_summary_table.c[column] + statement.excluded[column]
+                for column in ("post_count", "score_sum", "fact_checked_count", "fake_detected_count", "real_detected_count")
+            }
+        ),
+        [{"final_category": category, **category_totals} for category, category_totals in sorted(totals.items())]
+    )
+
+    problematic = [
+        {
+            "post_id": analysis["post_id"],
+            "global_reliability_score": analysis["global_reliability_score"],
+            "final_category": analysis["final_category"],
+            "is_fake_news": analysis["is_fake_news"],
+        }
+        for analysis in analyses
+        if analysis["global_reliability_score"] is not None and analysis["global_reliability_score"] < PROBLEMATIC_SCORE
+    ]
+    if problematic:
+        statement = pg_insert(reliability_lowest_scores_table)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["post_id"],
+                set_={column: statement.excluded[column] for column in ("global_reliability_score", "final_category", "is_fake_news")}
+            ),
+            problematic
+        )
+        connection.execute(text("""
+            DELETE FROM reliability_lowest_scores
+            WHERE post_id IN (
+                SELECT post_id FROM reliability_lowest_scores
+                ORDER BY global_reliability_score ASC, post_id
+                OFFSET :top_k
+            )
+        """), {"top_k": TOP_K})
+    refill_lowest_scores(connection)
+
+def refill_lowest_scores(connection):
+    """
+    Complète reliability_lowest_scores jusqu'à TOP_K lignes après des suppressions (posts supprimés
+    en cascade) : les analyses absentes de la table ont toutes un score au moins égal à celles
+    qu'elle contient, il suffit donc d'ajouter les suivantes par score croissant.
+    """
+    connection.execute(text("""
+        INSERT INTO reliability_lowest_scores (post_id, global_reliability_score, final_category, is_fake_news)
+        SELECT cra.post_id, cra.global_reliability_score, cra.final_category, cra.is_fake_news
+        FROM comprehensive_reliability_analysis cra
+        WHERE cra.global_reliability_score < :problematic_score
+        AND NOT EXISTS (SELECT 1 FROM reliability_lowest_scores l WHERE l.post_id = cra.post_id)
+        ORDER BY cra.global_reliability_score ASC, cra.post_id
+        LIMIT GREATEST(:top_k - (SELECT COUNT(*) FROM reliability_lowest_scores), 0)
+        ON CONFLICT (post_id) DO NOTHING
+    """), {"problematic_score": PROBLEMATIC_SCORE, "top_k": TOP_K})
+
+def rebuild_reliability_summary(connection=None):
+    """
+    Recalcule entièrement le résumé depuis comprehensive_reliability_analysis : à lancer après une
+    mise à jour en masse des analyses (recalcul des scores) ou des suppressions de posts
+    (les agrégats par catégorie ne sont pas décrémentés par les suppressions en cascade).
+    Les analyses sans catégorie finale forment leur propre groupe UNKNOWN_CATEGORY.
+    """
+    if connection is None:
+        with engine.begin() as connection:
+            return rebuild_reliability_summary(connection)
+
+    lock_summary(connection)
+    connection.execute(text("DELETE FROM reliability_summary"))
+    connection.execute(text("""
+        INSERT INTO reliability_summary
+            (final_category, post_count, score_sum, fact_checked_count, fake_detected_count, real_detected_count)
+        SELECT COALESCE(final_category, :unknown_category),
+               COUNT(*),
+               COALESCE(SUM(global_reliability_score), 0),
+               COUNT(*) FILTER (WHERE has_fact_check),
+               COUNT(*) FILTER (WHERE is_fake_news = 1),
+               COUNT(*) FILTER (WHERE is_fake_news = 0 AND final_category IS NOT NULL)
+        FROM comprehensive_reliability_analysis
+        GROUP BY COALESCE(final_category, :unknown_category)
+    """), {"unknown_category": UNKNOWN_CATEGORY})
+    connection.execute(text("DELETE FROM reliability_lowest_scores"))
+    connection.execute(text("""
+        INSERT INTO reliability_lowest_scores (post_id, global_reliability_score, final_category, is_fake_news)
+        SELECT post_id, global_reliability_score, final_category, is_fake_news
+        FROM comprehensive_reliability_analysis
+        WHERE global_reliability_score < :problematic_score
+        ORDER BY global_reliability_score ASC, post_id
+        LIMIT :top_k
+    """), {"problematic_score": PROBLEMATIC_SCORE, "top_k": TOP_K})
+    print("📋 Résumé de fiabilité recalculé")
+
+def ensure_reliability_summary(engine):
+    """
+    Construit le résumé d'une base existante dont les analyses sont antérieures au résumé, ou le
+    recalcule s'il date d'une version antérieure (SUMMARY_VERSION) ou si son nombre total d'analyses
+    ne correspond plus à la table (posts supprimés en cascade, qui ne décrémentent pas le résumé).
+    Complète sinon la liste des analyses les plus mal notées.
+    """
+    migration_name = f"reliability_summary_v{SUMMARY_VERSION}"
+    with engine.begin() as connection:
+        summary_current = connection.execute(
+            select(data_migrations_table.c.name).where(data_migrations_table.c.name == migration_name)
+        ).first() is not None
+        lock_summary(connection)
+        nb_analyses = connection.execute(text("SELECT COUNT(*) FROM comprehensive_reliability_analysis")).scalar()
+        nb_summarized = connection.execute(text("SELECT COALESCE(SUM(post_count), 0) FROM reliability_summary")).scalar()
+        if not summary_current:
+            if nb_analyses:
+                rebuild_reliability_summary(connection)
+            connection.execute(pg_insert(data_migrations_table).values(name=migration_name).on_conflict_do_nothing())
+        elif nb_summarized != nb_analyses:
+            print(f"📋 Résumé de fiabilité désynchronisé ({nb_summarized} analyse(s) résumée(s) pour {nb_analyses})")
+            rebuild_reliability_summary(connection)
+        else:
+            refill_lowest_scores(connection)
+
+def read_reliability_summary(limit=5):
+    """
+    Lit le résumé : (agrégats par catégorie triés par nombre de posts décroissant,
+    `limit` analyses les plus mal notées avec le titre du post).
+    """
+    with engine.connect() as connection:
+        categories = connection.execute(
+            select(reliability_summary_table).order_by(reliability_summary_table.c.post_count.desc())
+        ).fetchall()
+        problematic = connection.execute(text("""
+            SELECT p.title, l.global_reliability_score, l.final_category, l.is_fake_news
+            FROM reliability_lowest_scores l
+            JOIN posts p ON l.post_id = p.id
+            ORDER BY l.global_reliability_score ASC, l.post_id
+            LIMIT :limit
+        """), {"limit": limit}).fetchall()
+    return categories, problematic
@@ -0,0 +1,312 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Version des règles de calcul des scores et catégories (seuils, pondérations) : à changer à chaque
+# modification de ces règles, puis relancer rescore_analyses pour mettre à jour les analyses existantes
+SCORING_VERSION = "2024.1"
+
+# Ajustement du score de contenu selon la catégorie
+CATEGORY_SCORES = {
+    'Information factuelle': 20,
+    'Information générale': 10,
+    'Opinion neutre': 5,
+    'Opinion positive': 0,
+    'Opinion négative': -5,
+    'Indéterminé': -10
+}
+
+# Score externe selon le verdict du fact-check : le premier mot-clé trouvé dans le verdict l'emporte
+RATING_SCORES = {
+    'vrai': 95, 'true': 95, 'vérifié': 95, 'correct': 95,
+    'plutôt vrai': 80, 'mostly true': 80, 'largement vrai': 80,
+    'en partie vrai': 65, 'partly true': 65, 'partiellement vrai': 65,
+    'c\'est plus compliqué': 50, 'mixed': 50, 'nuancé': 50,
+    'plutôt faux': 25, 'mostly false': 25, 'largement faux': 25,
+    'faux': 5, 'false': 5, 'fake': 5, 'mensonge': 5,
+    'trompeur': 15, 'misleading': 15, 'désinformation': 10
+}
+
+# Sources très fiables (pondération 80% externe, 20% contenu)
+HIGH_TRUST_SOURCES = ["franceinfo", "afp factuel", "liberation", "le monde", "reuters", "bbc"]
+
+# Sources moyennement fiables (pondération 60% externe, 40% contenu)
+MEDIUM_TRUST_SOURCES = ["tf1 info", "20 minutes", "figaro", "ouest-france"]
+
+# Nombre de verdicts et de sources distincts gardés en mémoire par rating_score et source_trust
+MATCH_CACHE_SIZE = 100000
+
+class KeywordMatcher:
+    """
+    Recherche en une seule passe de plusieurs mots-clés dans un texte, avec une expression régulière
+    compilée. Les mots-clés sont donnés par ordre de priorité et match renvoie le plus prioritaire
+    contenu dans le texte : même résultat qu'un parcours `for mot in mots: if mot in texte`.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        # À chaque position, l'alternative retenue est la première (la plus prioritaire) qui y commence ;
+        # le lookahead permet de tester toutes les positions, y compris les occurrences qui se chevauchent
+        self.pattern = re.compile(
+            "(?=(" + "|".join(re.escape(keyword) for keyword in self.keywords) + "))"
+        ) if self.keywords else None
+        self.priorities = {keyword: priority for priority, keyword in enumerate(self.keywords)}
+
+    def match(self, text):
+        if self.pattern is None:
+            return None
+        found = [self.priorities[match.group(1)] for match in self.pattern.finditer(text)]
+        return self.keywords[min(found)] if found else None
+
+@lru_cache(maxsize=None)
+def get_rating_matcher():
+    return KeywordMatcher(RATING_SCORES)
+
+@lru_cache(maxsize=None)
+def get_source_matcher():
+    # Sources très fiables d'abord : une source qui contient les deux est considérée très fiable
+    return KeywordMatcher(list(HIGH_TRUST_SOURCES) + list(MEDIUM_TRUST_SOURCES))
+
+@lru_cache(maxsize=MATCH_CACHE_SIZE)
+def rating_score(rating):
+    """Score externe d'un verdict de fact-check (50 si aucun mot-clé connu), mémorisé par verdict"""
+    keyword = get_rating_matcher().match(rating.lower())
+    return RATING_SCORES[keyword] if keyword is not None else 50
+
+@lru_cache(maxsize=MATCH_CACHE_SIZE)
+def source_trust(source):
+    """Niveau de confiance d'une source de fact-check ("high", "medium" ou None), mémorisé par source"""
+    keyword = get_source_matcher().match(source.lower())
+    if keyword is None:
+        return None
+    return "high" if keyword in HIGH_TRUST_SOURCES else "medium"
+
+def configure_scoring_rules(rating_scores=None, high_trust_sources=None, medium_trust_sources=None):
+    """
+    Remplace les verdicts de fact-check et les listes de sources de confiance utilisés par les règles.
+    Les matchers compilés et les résultats mémorisés sont recalculés. Penser à changer SCORING_VERSION
+    si les analyses enregistrées doivent être recalculées.
+    """
+    if rating_scores is not None:
+        RATING_SCORES.clear()
+        RATING_SCORES.update(rating_scores)
+    if high_trust_sources is not None:
+        HIGH_TRUST_SOURCES[:] = high_trust_sources
+    if medium_trust_sources is not None:
+        MEDIUM_TRUST_SOURCES[:] = medium_trust_sources
+    for cached_function in (get_rating_matcher, get_source_matcher, rating_score, source_trust):
+        cached_function.cache_clear()
+
+def calculate_content_reliability_score(category, fake_confidence, content_confidence):
+    """Calcule le score de fiabilité basé sur le contenu"""
+    base_score = 50  # Score de base
+
+    # Ajustement selon la catégorie
+    category_adjustment = CATEGORY_SCORES.get(category, 0)
+
+    # Ajustement selon la détection fake news
+    fake_adjustment = -30 if fake_confidence > 0.7 else 0
+
+    # Ajustement selon la confiance dans la classification
+    confidence_adjustment = (content_confidence - 0.5) * 20
+
+    score = base_score + category_adjustment + fake_adjustment + confidence_adjustment
+    return max(0, min(100, score))  # Limiter entre 0 et 100
+
+def calculate_external_reliability_score(fact_check_data):
+    """Calcule le score de fiabilité basé sur les sources externes"""
+    if not fact_check_data:
+        return 50  # Score neutre si pas de fact-check
+
+    # 50 par défaut si le verdict ne contient aucun mot-clé connu
+    return rating_score(fact_check_data.get("rating", ""))
+
+def calculate_global_reliability_score(content_score, external_score, has_fact_check, fact_check_source=""):
+    """Calcule le score global de fiabilité avec pondération intelligente"""
+    if not has_fact_check:
+        return content_score
+
+    trust = source_trust(fact_check_source)
+
+    if trust == "high":
+        # Priorité forte aux sources très fiables
+        return (external_score * 0.8) + (content_score * 0.2)
+    elif trust == "medium":
+        # Pondération équilibrée pour sources moyennes
+        return (external_score * 0.6) + (content_score * 0.4)
+    else:
+        # Sources inconnues : équilibre 50/50
+        return (external_score * 0.5) + (content_score * 0.5)
+
+def determine_final_category(global_score, is_fake_news, fake_confidence, has_fact_check, external_score, fact_check_source=""):
+    """
+    Détermine la catégorie finale avec logique corrigée et seuils optimisés
+    Basé sur l'analyse d'évaluation qui montre une performance optimale au seuil 40
+    """
+
+    # 1. Si on a un fact-check de source très fiable (priorité absolue), on lui fait confiance
+    if has_fact_check and source_trust(fact_check_source) == "high":
+        if external_score >= 80:
+            return "Fiable"
+        elif external_score >= 60:
+            return "Plutôt fiable"
+        elif external_score <= 30:
+            return "Fake News"
+        else:
+            return "Douteux"
+
+    # 2. Si l'IA détecte clairement du fake news avec haute confiance
+    if is_fake_news == 1 and fake_confidence > 0.8:
+        return "Fake News"
+
+    # 3. Si l'IA dit que ce n'est PAS fake, on doit être cohérent
+    if is_fake_news == 0:
+        # Seuils optimisés basés sur l'évaluation (seuil optimal = 40)
+        if global_score >= 60:  # Abaissé de 70 à 60
+            return "Fiable"
+        elif global_score >= 40:  # Abaissé de 50 à 40 (seuil optimal)
+            return "Plutôt fiable"
+        elif global_score >= 25:  # Abaissé de 30 à 25
+            return "Douteux"
+        else:
+            return "Peu fiable"
+
+    # 4. Cas où is_fake_news == 1 mais confiance faible
+    if is_fake_news == 1:
+        if fake_confidence > 0.6:
+            return "Fake News"
+        elif global_score < 30:  # Abaissé de 40 à 30
+            return "Peu fiable"
+        else:
+            return "Douteux"
+
+    # 5. Cas par défaut : seuils optimisés pour le score global
+    if global_score >= 70:      # Abaissé de 80 à 70
+        return "Fiable"
+    elif global_score >= 50:    # Abaissé de 60 à 50
+        return "Plutôt fiable"
+    elif global_score >= 40:    # Seuil optimal identifié
+        return "Douteux"
+    elif global_score >= 20:    # Inchangé
+        return "Peu fiable"
+    else:
+        return "Non fiable"
+
+def determine_confidence_level(content_conf, fake_conf, has_fact_check):
+    """Détermine le niveau de confiance"""
+    avg_conf = (content_conf + fake_conf) / 2
+
+    if has_fact_check and avg_conf > 0.8:
+        return "Très élevée"
+    elif avg_conf > 0.7:
+        return "Élevée"
+    elif avg_conf > 0.5:
+        return "Moyenne"
+    else:
+        return "Faible"
+
+# Versions vectorisées des règles ci-dessus : elles prennent des colonnes (tableaux NumPy, listes ou
+# Series pandas) et renvoient des tableaux NumPy, avec les mêmes résultats que les versions ligne à ligne
+
+def map_distinct(values, function):
+    """
+    Applique `function` une seule fois par valeur distincte d'une colonne de textes (les valeurs
+    manquantes sont remplacées par une chaîne vide) et renvoie le tableau des résultats
+    """
+    codes, distinct_values = pd.factorize(pd.Series(values, dtype=object).fillna("").astype(str))
+    return np.array([function(value) for value in distinct_values], dtype=object)[codes]
+
+def content_reliability_scores(categories, fake_confidences, content_confidences):
+    """Version vectorisée de calculate_content_reliability_score"""
+    category_adjustments = pd.Series(categories, dtype=object).map(CATEGORY_SCORES).fillna(0).to_numpy(dtype=float)
+    fake_adjustments = np.where(np.asarray(fake_confidences, dtype=float) > 0.7, -30, 0)
+    confidence_adjustments = (np.asarray(content_confidences, dtype=float) - 0.5) * 20
+    scores = 50 + category_adjustments + fake_adjustments + confidence_adjustments
+    return np.clip(scores, 0, 100)
+
+def external_reliability_scores(ratings, has_fact_check):
+    """Version vectorisée de calculate_external_reliability_score (le verdict vaut None sans fact-check)"""
+    scores = map_distinct(ratings, rating_score).astype(float)
+    return np.where(np.asarray(has_fact_check, dtype=bool), scores, 50.0)
+
+def global_reliability_scores(content_scores, external_scores, has_fact_check, fact_check_sources):
+    """Version vectorisée de calculate_global_reliability_score"""
+    content_scores = np.asarray(content_scores, dtype=float)
+    external_scores = np.asarray(external_scores, dtype=float)
+    trust = map_distinct(fact_check_sources, source_trust)
+    return np.select(
+        [
+            ~np.asarray(has_fact_check, dtype=bool),
+            trust == "high",
+            trust == "medium",
+        ],
+        [
+            content_scores,
+            (external_scores * 0.8) + (content_scores * 0.2),
+            (external_scores * 0.6) + (content_scores * 0.4),
+        ],
+        default=(external_scores * 0.5) + (content_scores * 0.5)
+    )
+
+def final_categories(global_scores, is_fake_news, fake_confidences, has_fact_check, external_scores, fact_check_sources):
+    """Version vectorisée de determine_final_category : les conditions sont évaluées dans le même ordre"""
+    global_scores = np.asarray(global_scores, dtype=float)
+    is_fake_news = np.asarray(is_fake_news)
+    fake_confidences = np.asarray(fake_confidences, dtype=float)
+    external_scores = np.asarray(external_scores, dtype=float)
+    trusted_fact_check = np.asarray(has_fact_check, dtype=bool) & (map_distinct(fact_check_sources, source_trust) == "high")
+    real, fake = is_fake_news == 0, is_fake_news == 1
+
+    rules = [
+        # 1. Fact-check d'une source très fiable
+        (trusted_fact_check & (external_scores >= 80), "Fiable"),
+        (trusted_fact_check & (external_scores >= 60), "Plutôt fiable"),
+        (trusted_fact_check & (external_scores <= 30), "Fake News"),
+        (trusted_fact_check, "Douteux"),
+        # 2. Fake news détectée avec haute confiance
+        (fake & (fake_confidences > 0.8), "Fake News"),
+        # 3. Pas fake selon l'IA
+        (real & (global_scores >= 60), "Fiable"),
+        (real & (global_scores >= 40), "Plutôt fiable"),
+        (real & (global_scores >= 25), "Douteux"),
+        (real, "Peu fiable"),
+        # 4. Fake selon l'IA mais confiance faible
+        (fake & (fake_confidences > 0.6), "Fake News"),
+        (fake & (global_scores < 30), "Peu fiable"),
+        (fake, "Douteux"),
+        # 5. Cas par défaut
+        (global_scores >= 70, "Fiable"),
+        (global_scores >= 50, "Plutôt fiable"),
+        (global_scores >= 40, "Douteux"),
+        (global_scores >= 20, "Peu fiable"),
+    ]
+    return np.select([condition for condition, _ in rules], [category for _, category in rules], default="Non fiable").astype(object)
+
+def confidence_levels(content_confidences, fake_confidences, has_fact_check):
+    """Version vectorisée de determine_confidence_level"""
+    avg_conf = (np.asarray(content_confidences, dtype=float) + np.asarray(fake_confidences, dtype=float)) / 2
+    return np.select(
+        [np.asarray(has_fact_check, dtype=bool) & (avg_conf > 0.8), avg_conf > 0.7, avg_conf > 0.5],
+        ["Très élevée", "Élevée", "Moyenne"],
+        default="Faible"
+    ).astype(object)
+
+def score_frame(frame):
+    """
+    Recalcule en une fois les colonnes dérivées d'un DataFrame d'analyses, à partir des colonnes
+    content_category, content_confidence, is_fake_news, fake_news_confidence, has_fact_check,
+    fact_check_rating et fact_check_source. Renvoie un nouveau DataFrame (même index).
+    """
+    has_fact_check = frame["has_fact_check"].fillna(False).astype(bool).to_numpy()
+    content_scores = content_reliability_scores(frame["content_category"], frame["fake_news_confidence"], frame["content_confidence"])
+    external_scores = external_reliability_scores(frame["fact_check_rating"], has_fact_check)
+    global_scores = global_reliability_scores(content_scores, external_scores, has_fact_check, frame["fact_check_source"])
+    return pd.DataFrame({
+        "content_reliability_score": content_scores.round(2),
+        "external_reliability_score": external_scores.round(2),
+        "global_reliability_score": global_scores.round(2),
+        "final_category": final_categories(global_scores, frame["is_fake_news"], frame["fake_news_confidence"],
+                                           has_fact_check, external_scores, frame["fact_check_source"]),
+        "confidence_level": confidence_levels(frame["content_confidence"], frame["fake_news_confidence"], has_fact_check),
+    }, index=frame.index)
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db.db_connection import get_engine
+from db.create_tables import inference_cache_table
+
+engine = get_engine()
+
+# Taille maximale du cache mémoire (entrées) et de la table inference_cache (lignes)
+MEMORY_MAX_ENTRIES = int(os.getenv("INFERENCE_CACHE_MEMORY_SIZE", 20000))
+DB_MAX_ROWS = int(os.getenv("INFERENCE_CACHE_MAX_ROWS", 500000))
+# Nombre d'insertions entre deux purges de la table
+EVICTION_INTERVAL = 5000
+
+# (modèle, révision, hash) -> sorties brutes du modèle, de la moins à la plus récemment utilisée
+memory_cache = OrderedDict()
+cache_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "evictions": 0}
+inserts_since_eviction = 0
+# Protège memory_cache, cache_stats et inserts_since_eviction : le cache est partagé par les threads
+# d'inférence concurrente et par ceux du service d'analyse (les requêtes en base se font hors verrou)
+cache_lock = threading.Lock()
+
+def normalized_text_hash(text):
+    """Empreinte SHA-256 du texte aux espaces près (espaces multiples et en bordure ignorés)."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def get_cache_stats():
+    """Copie des compteurs du cache d'inférence, avec le taux de réussite global."""
+    with cache_lock:
+        stats = dict(cache_stats)
+    total = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / total if total else 0.0
+    return stats
+
+def remember(key, outputs):
+    """Ajoute une entrée au cache mémoire (à appeler sous cache_lock)."""
+    memory_cache[key] = outputs
+    memory_cache.move_to_end(key)
+    while len(memory_cache) > MEMORY_MAX_ENTRIES:
+        memory_cache.popitem(last=False)
+
+def lookup(model_name, model_revision, texts):
+    """
+    Cherche les sorties déjà calculées pour chaque texte : cache mémoire, puis table inference_cache.
+    Renvoie une liste alignée sur `texts`, avec None pour les textes jamais vus.
+    """
+    hashes = [normalized_text_hash(text) for text in texts]
+    results = [None] * len(texts)
+
+    missing = {}
+    with cache_lock:
+        for i, text_hash in enumerate(hashes):
+            key = (model_name, model_revision, text_hash)
+            if key in memory_cache:
+                memory_cache.move_to_end(key)
+                results[i] = memory_cache[key]
+                cache_stats["memory_hits"] += 1
+            else:
+                missing.setdefault(text_hash, []).append(i)
+
+    if missing:
+        try:
+            with engine.begin() as connection:
+                rows = connection.execute(
+                    select(inference_cache_table.c.text_hash, inference_cache_table.c.outputs)
+                    .where(inference_cache_table.c.model_name == model_name)
+                    .where(inference_cache_table.c.model_revision == model_revision)
+                    .where(inference_cache_table.c.text_hash.in_(list(missing)))
+                ).fetchall()
+                if rows:
+                    connection.execute(
+                        update(inference_cache_table)
+                        .where(inference_cache_table.c.model_name == model_name)
+                        .where(inference_cache_table.c.model_revision == model_revision)
+                        .where(inference_cache_table.c.text_hash.in_([row.text_hash for row in rows]))
+                        .values(last_used_at=func.now())
+                    )
+        except Exception as e:
+            print(f"⚠️  Cache d'inférence indisponible: {e}")
+            rows = []
+
+        with cache_lock:
+            for row in rows:
+                remember((model_name, model_revision, row.text_hash), row.outputs)
+                for i in missing.pop(row.text_hash):
+                    results[i] = row.outputs
+                    cache_stats["db_hits"] += 1
+
+    with cache_lock:
+        cache_stats["misses"] += sum(len(indices) for indices in missing.values())
+    return results
+
+def store(model_name, model_revision, texts, outputs):
+    """Enregistre les sorties brutes calculées pour ces textes (mémoire et table inference_cache)."""
+    global inserts_since_eviction
+
+    rows = {}
+    for text, output in zip(texts, outputs):
+        text_hash = normalized_text_hash(text)
+        rows[text_hash] = {
+            "model_name": model_name,
+            "model_revision": model_revision,
+            "text_hash": text_hash,
+            "outputs": output,
+        }
+    if not rows:
+        return
+
+    with cache_lock:
+        for text_hash, row in rows.items():
+            remember((model_name, model_revision, text_hash), row["outputs"])
+
+    try:
+        with engine.begin() as connection:
+            connection.execute(pg_insert(inference_cache_table).values(list(rows.values())).on_conflict_do_nothing())
+        with cache_lock:
+            inserts_since_eviction += len(rows)
+            should_evict = inserts_since_eviction >= EVICTION_INTERVAL
+            if should_evict:
+                # Remis à zéro ici pour qu'un seul thread lance la purge
+                inserts_since_eviction = 0
+        if should_evict:
+            evict()
+    except Exception as e:
+        print(f"⚠️  Cache d'inférence indisponible: {e}")
+
+def evict(max_rows=None):
+    """Supprime les lignes les moins récemment utilisées au-delà de max_rows."""
+    global inserts_since_eviction
+
+    with engine.begin() as connection:
+        result = connection.execute(text("""
+            DELETE FROM inference_cache
+            WHERE (model_name, model_revision, text_hash) IN (
+                SELECT model_name, model_revision, text_hash
+                FROM inference_cache
+                ORDER BY last_used_at DESC
+                OFFSET :max_rows
+            )
+        """), {"max_rows": max_rows or DB_MAX_ROWS})
+    with cache_lock:
+        cache_stats["evictions"] += result.rowcount
+        inserts_since_eviction = 0
+
+def print_cache_stats():
+    stats = get_cache_stats()
+    print(f"Cache d'inférence: {stats['memory_hits']} succès mémoire, {stats['db_hits']} succès base, "
+          f"{stats['misses']} inférences ({stats['hit_rate']:.0%} évitées), {stats['evictions']} entrée(s) purgée(s)")
@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+
+# Modèles utilisés par le projet : clé -> nom Hugging Face, tâche et options du pipeline
+MODEL_SPECS = {
+    "language_detection": {
+        "model_name": "papluca/xlm-roberta-base-language-detection",
+        "task": "text-classification",
+        "options": {},
+    },
+    "emotion_roberta": {
+        "model_name": "j-hartmann/emotion-english-distilroberta-base",
+        "task": "text-classification",
+        "options": {"top_k": None},
+    },
+    "emotion_bert": {
+        "model_name": "bhadresh-savani/distilbert-base-uncased-emotion",
+        "task": "text-classification",
+        "options": {"top_k": None},
+    },
+    "content_classification": {
+        "model_name": "cardiffnlp/twitter-roberta-base-sentiment-latest",
+        "task": "text-classification",
+        "options": {},
+    },
+    "fake_news": {
+        "model_name": "hamzab/roberta-fake-news-classification",
+        "task": "text-classification",
+        "options": {},
+    },
+}
+
+# Moteurs d'inférence disponibles pour les modèles de classification :
+# - pytorch : exécution PyTorch classique
+# - int8 : quantification dynamique int8 des couches linéaires (CPU)
+# - onnx : export ONNX exécuté avec ONNX Runtime (dépendance optionnelle optimum[onnxruntime])
+INFERENCE_BACKENDS = ("pytorch", "int8", "onnx")
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model_cache")
+# Bibliothèques dont dépendent les artefacts int8 (module pickle) et onnx (export) mis en cache
+BACKEND_LIBRARIES = {"int8": ("torch", "transformers"), "onnx": ("optimum", "onnxruntime", "transformers")}
+# Accord minimal sur le label avec pytorch (rapport de compare_backends) pour utiliser int8 ou onnx
+MIN_BACKEND_AGREEMENT = float(os.getenv("MODEL_BACKEND_MIN_AGREEMENT", 0.98))
+
+pipelines = {}
+load_times = {}
+registry_lock = threading.Lock()
+
+def register_model(key, model_name, task="text-classification", backend=None, **options):
+    """Déclare un modèle supplémentaire, chargé lui aussi au premier appel de get_pipeline."""
+    MODEL_SPECS[key] = {"model_name": model_name, "task": task, "options": options}
+    if backend:
+        MODEL_SPECS[key]["backend"] = backend
+
+def get_backend_name(key):
+    """
+    Moteur d'inférence d'un modèle : variable MODEL_BACKEND_<CLÉ> (ex. MODEL_BACKEND_FAKE_NEWS=onnx),
+    sinon MODEL_BACKEND, sinon celui de la déclaration du modèle, sinon pytorch.
+    """
+    backend = (
+        os.getenv(f"MODEL_BACKEND_{key.upper()}")
+        or os.getenv("MODEL_BACKEND")
+        or MODEL_SPECS[key].get("backend", "pytorch")
+    )
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Moteur d'inférence inconnu pour {key}: {backend} (disponibles: {', '.join(INFERENCE_BACKENDS)})")
+    if MODEL_SPECS[key]["task"] != "text-classification":
+        return "pytorch"
+    if backend != "pytorch" and not is_backend_validated(key, backend):
+        return "pytorch"
+    return backend
+
+def library_versions(packages):
+    """Versions installées des bibliothèques, sous forme de nom de dossier (ex. torch-2.3.0_transformers-4.41.2)."""
+    parts = []
+    for package in packages:
+        try:
+            parts.append(f"{package}-{version(package)}")
+        except PackageNotFoundError:
+            parts.append(f"{package}-absent")
+    return "_".join(parts)
+
+def get_artifact_dir(key, backend):
+    """
+    Dossier des artefacts d'un moteur int8 ou onnx : MODEL_CACHE_DIR/<clé>/<commit>/<moteur>_<versions>.
+    Un artefact n'est réutilisé que pour le même commit du modèle et les mêmes versions des bibliothèques
+    qui l'ont produit (un module pickle ou un export ne se relit pas d'une version à l'autre).
+    """
+    return os.path.join(MODEL_CACHE_DIR, key, get_upstream_revision(key), f"{backend}_{library_versions(BACKEND_LIBRARIES[backend])}")
+
+def agreement_report_path(key, backend):
+    return os.path.join(get_artifact_dir(key, backend), "agreement.json")
+
+@lru_cache(maxsize=None)
+def is_backend_validated(key, backend):
+    """
+    Un moteur int8 ou onnx n'est utilisé qu'après un rapport d'accord avec pytorch (compare_backends,
+    sur des posts réels) atteignant MIN_BACKEND_AGREEMENT pour ce commit et ces versions ; sinon le
+    modèle reste en pytorch, avec un avertissement.
+    """
+    path = agreement_report_path(key, backend)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️  Moteur {backend} non validé pour {key} (pas de rapport {path}) : pytorch utilisé. "
+              f"Lancer python -m model_analysis.model_registry {key} {backend}")
+        return False
+    if report["nb_texts"] == 0 or report["label_agreement"] < MIN_BACKEND_AGREEMENT:
+        print(f"⚠️  Moteur {backend} refusé pour {key} (accord {report['label_agreement']:.1%} < "
+              f"{MIN_BACKEND_AGREEMENT:.1%}) : pytorch utilisé")
+        return False
+    return True
+
+@lru_cache(maxsize=None)
+def get_upstream_revision(key):
+    """
+    Commit Hugging Face du modèle déclaré, lu dans sa configuration (sans charger les poids).
+    Les artefacts dérivés (int8, ONNX) sont rangés par commit pour ne jamais resservir
+    un export d'une version antérieure du modèle.
+    """
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(MODEL_SPECS[key]["model_name"])
+    return getattr(config, "_commit_hash", None) or "unknown"
+
+def load_int8_model(key, model_name):
+    """
+    Modèle quantifié en int8, mis en cache sur disque après la première quantification
+    (par commit et versions de torch et transformers, voir get_artifact_dir).
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    revision = get_upstream_revision(key)
+    cache_path = os.path.join(get_artifact_dir(key, "int8"), "int8.pt")
+    if os.path.exists(cache_path):
+        return torch.load(cache_path, weights_only=False)
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_name, revision=revision if revision != "unknown" else None)
+    quantized_model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    torch.save(quantized_model, cache_path)
+    return quantized_model
+
+def load_onnx_model(key, model_name):
+    """Modèle exporté en ONNX pour ONNX Runtime, export mis en cache sur disque (voir get_artifact_dir)."""
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError as e:
+        raise ImportError("Le moteur onnx nécessite optimum[onnxruntime] (pip install optimum[onnxruntime])") from e
+
+    revision = get_upstream_revision(key)
+    cache_dir = get_artifact_dir(key, "onnx")
+    if os.path.exists(os.path.join(cache_dir, "model.onnx")):
+        return ORTModelForSequenceClassification.from_pretrained(cache_dir)
+
+    model = ORTModelForSequenceClassification.from_pretrained(
+        model_name, export=True, revision=revision if revision != "unknown" else None
+    )
+    model.save_pretrained(cache_dir)
+    return model
+
+def load_pipeline(key, backend=None):
+    # transformers (et torch) ne sont importés qu'au premier chargement de modèle :
+    # les commandes qui n'utilisent aucun modèle démarrent sans eux
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    spec = MODEL_SPECS[key]
+    if spec["task"] != "text-classification":
+        return pipeline(spec["task"], model=spec["model_name"], **spec["options"])
+
+    backend = backend or get_backend_name(key)
+    tokenizer = AutoTokenizer.from_pretrained(spec["model_name"])
+    if backend == "int8":
+        model = load_int8_model(key, spec["model_name"])
+    elif backend == "onnx":
+        model = load_onnx_model(key, spec["model_name"])
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(spec["model_name"])
+    return pipeline(spec["task"], model=model, tokenizer=tokenizer, **spec["options"])
+
+def get_pipeline(key):
+    """
+    Renvoie le pipeline associé à la clé, chargé une seule fois par processus au premier appel
+    puis partagé par tous les modules. Le temps de chargement est mesuré et conservé.
+    """
+    if key in pipelines:
+        return pipelines[key]
+
+    with registry_lock:
+        if key not in pipelines:
+            if key not in MODEL_SPECS:
+                raise KeyError(f"Modèle inconnu: {key} (disponibles: {', '.join(MODEL_SPECS)})")
+            spec = MODEL_SPECS[key]
+            start_time = time.time()
+            pipelines[key] = load_pipeline(key)
+            load_times[key] = time.time() - start_time
+            print(f"Modèle {key} ({spec['model_name']}, {get_backend_name(key)}) chargé en {load_times[key]:.1f}s")
+    return pipelines[key]
+
+def get_model_revision(key):
+    """
+    Révision du modèle (commit Hugging Face) et moteur d'inférence utilisé : deux révisions
+    différentes peuvent donner des sorties différentes pour un même texte. Un modèle chargé donne
+    son propre commit ; sinon il est lu dans la configuration, sans charger les poids.
+    """
+    nlp = pipelines.get(key)
+    commit_hash = getattr(nlp.model.config, "_commit_hash", None) if nlp is not None else None
+    return f"{commit_hash or get_upstream_revision(key)}:{get_backend_name(key)}"
+
+def is_loaded(key):
+    return key in pipelines
+
+def get_load_times():
+    """Temps de chargement (en secondes) des modèles chargés dans ce processus."""
+    return dict(load_times)
+
+def print_load_times():
+    if not load_times:
+        print("Aucun modèle chargé.")
+        return
+    print("Temps de chargement des modèles:")
+    for key, seconds in sorted(load_times.items(), key=lambda item: item[1], reverse=True):
+        print(f"   • {key}: {seconds:.1f}s")
+
+def top_prediction(output):
+    """Label et score les plus probables d'une sortie de pipeline (avec ou sans top_k=None)."""
+    if isinstance(output, list):
+        output = max(output, key=lambda prediction: prediction["score"])
+    return output["label"], output["score"]
+
+def sample_translated_posts(limit=500):
+    """
+    Textes réels pour compare_backends : traductions déjà en cache (translation_cache) d'un échantillon
+    aléatoire de posts, tels que les modèles les reçoivent (titre et contenu, ou contenu seul).
+    """
+    from sqlalchemy import text
+    from db.db_connection import get_engine
+    from model_analysis.translation import content_hash
+
+    with get_engine().connect() as connection:
+        posts = connection.execute(text("""
+            SELECT title, content FROM posts ORDER BY random() LIMIT :limit
+        """), {"limit": limit}).fetchall()
+        hashes = set()
+        for title, content in posts:
+            hashes.add(content_hash(content or ""))
+            if title and title != "None":
+                hashes.add(content_hash(f"{title} {content}"))
+        rows = connection.execute(text("""
+            SELECT DISTINCT ON (content_hash) translated_text
+            FROM translation_cache
+            WHERE content_hash = ANY(:hashes)
+            ORDER BY content_hash, created_at DESC
+        """), {"hashes": list(hashes)}).fetchall()
+    return [row.translated_text for row in rows][:limit]
+
+def compare_backends(key, texts, backend, reference_backend="pytorch", batch_size=16, save=True):
+    """
+    Rapport d'accord entre deux moteurs d'inférence d'un même modèle sur les mêmes textes :
+    taux d'accord sur le label prédit (global et par label de référence), désaccords par paire de
+    labels, écarts de score et temps d'inférence de chaque moteur. Comparé à pytorch et avec save=True,
+    le rapport est enregistré à côté de l'artefact : c'est lui qui autorise le moteur (is_backend_validated).
+    """
+    results = {}
+    for name in (reference_backend, backend):
+        nlp = load_pipeline(key, backend=name)
+        start_time = time.time()
+        outputs = nlp(list(texts), batch_size=batch_size, truncation=True)
+        results[name] = {"predictions": [top_prediction(output) for output in outputs], "seconds": time.time() - start_time}
+
+    reference, candidate = results[reference_backend]["predictions"], results[backend]["predictions"]
+    agreements = [ref_label == cand_label for (ref_label, _), (cand_label, _) in zip(reference, candidate)]
+    score_deltas = [
+        abs(ref_score - cand_score)
+        for (ref_label, ref_score), (cand_label, cand_score) in zip(reference, candidate)
+        if ref_label == cand_label
+    ]
+    reference_labels = Counter(ref_label for ref_label, _ in reference)
+    disagreements = Counter(
+        f"{ref_label} → {cand_label}"
+        for (ref_label, _), (cand_label, _) in zip(reference, candidate)
+        if ref_label != cand_label
+    )
+    reference_disagreements = Counter(
+        ref_label for (ref_label, _), (cand_label, _) in zip(reference, candidate) if ref_label != cand_label
+    )
+    label_agreement_by_label = {
+        label: 1 - reference_disagreements[label] / count for label, count in reference_labels.items()
+    }
+    report = {
+        "model": key,
+        "backend": backend,
+        "reference_backend": reference_backend,
+        "nb_texts": len(texts),
+        "label_agreement": sum(agreements) / len(agreements) if agreements else 1.0,
+        "label_agreement_by_label": label_agreement_by_label,
+        "disagreements": dict(disagreements.most_common()),
+        "mean_score_delta": sum(score_deltas) / len(score_deltas) if score_deltas else 0.0,
+        "max_score_delta": max(score_deltas, default=0.0),
+        "reference_seconds": results[reference_backend]["seconds"],
+        "backend_seconds": results[backend]["seconds"],
+    }
+
+    print(f"\n📋 ACCORD {backend.upper()} / {reference_backend.upper()} - {key}")
+    print(f"   • Accord sur le label: {report['label_agreement']:.1%} ({len(texts)} textes)")
+    for label, agreement in sorted(label_agreement_by_label.items()):
+        print(f"     - {label}: {agreement:.1%} ({reference_labels[label]} textes)")
+    for pair, count in disagreements.most_common(10):
+        print(f"   • Désaccord {pair}: {count}")
+    print(f"   • Écart de score moyen: {report['mean_score_delta']:.4f} (max {report['max_score_delta']:.4f})")
+    print(f"   • Temps: {report['reference_seconds']:.2f}s ({reference_backend}) / {report['backend_seconds']:.2f}s ({backend})")
+
+    if save and reference_backend == "pytorch" and backend in BACKEND_LIBRARIES:
+        path = agreement_report_path(key, backend)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        is_backend_validated.cache_clear()
+        status = "validé" if report["nb_texts"] and report["label_agreement"] >= MIN_BACKEND_AGREEMENT else "refusé"
+        print(f"   • Moteur {backend} {status} pour {key} (seuil {MIN_BACKEND_AGREEMENT:.1%}), rapport: {path}")
+    return report
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage : python -m model_analysis.model_registry <clé du modèle> <int8|onnx> [nombre de posts]
+    # Compare le moteur à pytorch sur des posts réels déjà traduits et enregistre le rapport qui l'autorise
+    model_key = sys.argv[1] if len(sys.argv) > 1 else "fake_news"
+    candidate_backend = sys.argv[2] if len(sys.argv) > 2 else "int8"
+    sample_texts = sample_translated_posts(int(sys.argv[3]) if len(sys.argv) > 3 else 500)
+    if not sample_texts:
+        print("Aucun post traduit en base : lancer d'abord une analyse pour remplir translation_cache.")
+        sys.exit(1)
+    compare_backends(model_key, sample_texts, candidate_backend)
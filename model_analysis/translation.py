@@ -0,0 +1,210 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from deep_translator import GoogleTranslator
+from model_analysis.model_registry import MODEL_SPECS, get_pipeline, get_upstream_revision, register_model
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db.db_connection import get_engine
+from db.create_tables import translation_cache_table
+
+engine = get_engine()
+
+# Taille maximale du cache mémoire des traductions (entrées)
+MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MEMORY_SIZE", 20000))
+
+# Cache mémoire devant la table translation_cache : (moteur, source, cible, hash) -> traduction,
+# de la moins à la plus récemment utilisée, partagé par les threads d'un même processus
+memory_cache = OrderedDict()
+cache_lock = threading.Lock()
+
+def remember(translations):
+    """Ajoute des traductions au cache mémoire en retirant les moins récemment utilisées au-delà de MEMORY_MAX_ENTRIES."""
+    with cache_lock:
+        for key, translated_text in translations.items():
+            memory_cache[key] = translated_text
+            memory_cache.move_to_end(key)
+        while len(memory_cache) > MEMORY_MAX_ENTRIES:
+            memory_cache.popitem(last=False)
+
+def content_hash(text):
+    """Empreinte SHA-256 du texte, utilisée comme clé du cache de traduction."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def group_by_char_budget(texts, max_chars):
+    """Regroupe les textes en lots consécutifs dont la taille cumulée (séparateurs compris) reste sous max_chars."""
+    batches, batch, batch_chars = [], [], 0
+    for text in texts:
+        if batch and batch_chars + len(text) + 1 > max_chars:
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(text)
+        batch_chars += len(text) + 1
+    if batch:
+        batches.append(batch)
+    return batches
+
+class GoogleTranslationBackend:
+    """
+    Traduction en ligne via Google Translate. L'API n'ayant pas de point d'entrée par lots,
+    les textes d'un lot sont joints par des retours à la ligne dans une seule requête
+    (sous la limite de caractères de l'API) puis redécoupés.
+    """
+    name = "google"
+
+    def __init__(self, source='fr', target='en', max_chars=4500):
+        self.translator = GoogleTranslator(source=source, target=target)
+        self.max_chars = max_chars
+
+    @property
+    def cache_name(self):
+        """Nom du moteur dans les clés du cache de traduction."""
+        return self.name
+
+    def translate_one(self, text):
+        if not text.strip():
+            return text
+        return self.translator.translate(text) or text
+
+    def translate_batch(self, texts):
+        translations = []
+        for batch in group_by_char_budget(texts, self.max_chars):
+            if len(batch) == 1 or any("\n" in text for text in batch):
+                translations.extend(self.translate_one(text) for text in batch)
+                continue
+            translated = (self.translator.translate("\n".join(batch)) or "").split("\n")
+            if len(translated) != len(batch):
+                # Le découpage n'a pas été préservé : on retraduit le lot texte par texte
+                translated = [self.translate_one(text) for text in batch]
+            translations.extend(translated)
+        return translations
+
+class MarianTranslationBackend:
+    """
+    Traduction hors ligne avec un modèle MarianMT (Helsinki-NLP/opus-mt) exécuté localement sur CPU,
+    par lots de `batch_size` textes.
+    """
+    name = "marian"
+
+    def __init__(self, source='fr', target='en', batch_size=16):
+        self.model_key = f"translation_{source}_{target}"
+        if self.model_key not in MODEL_SPECS:
+            register_model(self.model_key, f"Helsinki-NLP/opus-mt-{source}-{target}", task="translation")
+        self.batch_size = batch_size
+
+    @property
+    def cache_name(self):
+        """Nom du moteur et commit du modèle dans les clés du cache de traduction."""
+        return f"{self.name}:{get_upstream_revision(self.model_key)}"
+
+    def translate_batch(self, texts):
+        results = get_pipeline(self.model_key)(list(texts), batch_size=self.batch_size, truncation=True)
+        return [result["translation_text"] for result in results]
+
+TRANSLATION_BACKENDS = {
+    GoogleTranslationBackend.name: GoogleTranslationBackend,
+    MarianTranslationBackend.name: MarianTranslationBackend,
+}
+
+@lru_cache(maxsize=None)
+def get_backend(name, source='fr', target='en'):
+    """Instancie une seule fois chaque moteur de traduction ("google" ou "marian")."""
+    if name not in TRANSLATION_BACKENDS:
+        raise ValueError(f"Moteur de traduction inconnu: {name} (disponibles: {', '.join(TRANSLATION_BACKENDS)})")
+    return TRANSLATION_BACKENDS[name](source, target)
+
+def default_backend_name():
+    """Moteur choisi par la variable d'environnement TRANSLATION_BACKEND (google par défaut)."""
+    return os.getenv("TRANSLATION_BACKEND", GoogleTranslationBackend.name)
+
+def translate_texts(texts, source='fr', target='en', backend=None):
+    """
+    Traduit une liste de textes en passant par le cache : mémoire, puis table translation_cache,
+    et seulement en dernier recours par le moteur de traduction, appelé une fois par lot pour
+    l'ensemble des textes jamais vus. Chaque texte n'est donc traduit qu'une fois par moteur
+    (et par révision du modèle Marian), quel que soit le nombre de modèles qui l'utilisent.
+    """
+    translation_backend = get_backend(backend or default_backend_name(), source, target)
+    cache_name = translation_backend.cache_name
+    keys = [(cache_name, source, target, content_hash(text)) for text in texts]
+    with cache_lock:
+        translations = {key: memory_cache[key] for key in keys if key in memory_cache}
+
+    # Recherche en base des textes absents du cache mémoire
+    missing_hashes = {key[3] for key in keys if key not in translations}
+    if missing_hashes:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(translation_cache_table.c.content_hash, translation_cache_table.c.translated_text)
+                .where(translation_cache_table.c.backend == cache_name)
+                .where(translation_cache_table.c.source_lang == source)
+                .where(translation_cache_table.c.target_lang == target)
+                .where(translation_cache_table.c.content_hash.in_(missing_hashes))
+            ).fetchall()
+        for row in rows:
+            translations[(cache_name, source, target, row.content_hash)] = row.translated_text
+
+    # Traduction des textes jamais vus, en un seul appel au moteur
+    to_translate = {}
+    for text, key in zip(texts, keys):
+        if key not in translations:
+            to_translate[key] = text
+
+    new_rows = []
+    if to_translate:
+        translated_texts = translation_backend.translate_batch(list(to_translate.values()))
+        for (key, text), translated_text in zip(to_translate.items(), translated_texts):
+            translations[key] = translated_text or text
+            new_rows.append({
+                "backend": cache_name,
+                "source_lang": source,
+                "target_lang": target,
+                "content_hash": key[3],
+                "translated_text": translations[key]
+            })
+
+    if new_rows:
+        with engine.begin() as connection:
+            connection.execute(
+                pg_insert(translation_cache_table)
+                .values(new_rows)
+                .on_conflict_do_nothing()
+            )
+
+    remember(translations)
+    return [translations[key] for key in keys]
+
+def translate(text, source='fr', target='en', backend=None):
+    """Traduit un texte en passant par le cache de traduction."""
+    return translate_texts([text], source, target, backend)[0]
+
+def benchmark_backends(texts, backends=("google", "marian"), source='fr', target='en'):
+    """
+    Compare le débit des moteurs de traduction sur les mêmes textes, sans passer par le cache.
+    Le temps de chargement du moteur n'est pas compté.
+    """
+    results = {}
+    for name in backends:
+        translation_backend = get_backend(name, source, target)
+        start_time = time.time()
+        translation_backend.translate_batch(texts)
+        elapsed = time.time() - start_time
+        results[name] = {
+            "seconds": elapsed,
+            "texts_per_second": len(texts) / elapsed if elapsed else float("inf"),
+            "chars_per_second": sum(len(text) for text in texts) / elapsed if elapsed else float("inf"),
+        }
+        print(f"{name}: {len(texts)} textes en {elapsed:.2f}s ({results[name]['texts_per_second']:.1f} textes/s)")
+    return results
+
+if __name__ == "__main__":
+    sample_texts = [
+        "Le gouvernement a présenté une nouvelle réforme des retraites.",
+        "Les prix de l'énergie continuent d'augmenter en Europe.",
+        "Une étude montre que la qualité de l'air s'améliore dans les grandes villes.",
+        "Le match de ce soir a été reporté en raison des intempéries.",
+    ] * 25
+    benchmark_backends(sample_texts)
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pytest
+from model_analysis.fake_news_detection.scoring import (
+    CATEGORY_SCORES,
+    HIGH_TRUST_SOURCES,
+    MEDIUM_TRUST_SOURCES,
+    RATING_SCORES,
+    calculate_content_reliability_score,
+    calculate_external_reliability_score,
+    calculate_global_reliability_score,
+    confidence_levels,
+    content_reliability_scores,
+    determine_confidence_level,
+    determine_final_category,
+    external_reliability_scores,
+    final_categories,
+    global_reliability_scores,
+    rating_score,
+    score_frame,
+    source_trust,
+)
+
+# Cas écrits à la main autour des seuils stricts (> 0.6, > 0.7, > 0.8) et larges (>= 25, >= 40, >= 60...)
+CONTENT_SCORE_CASES = [
+    # (catégorie, confiance fake, confiance contenu, score attendu)
+    ("Information factuelle", 0.7, 0.5, 70),
+    ("Information factuelle", 0.70003, 0.5, 40),
+    ("Opinion négative", 0.9, 1.0, 25),
+    ("Autre", 0.0, 0.0, 40),
+    ("Indéterminé", 0.71, 0.0, 0),
+]
+
+FINAL_CATEGORY_CASES = [
+    # (score global, is_fake_news, confiance fake, fact-check, score externe, source, catégorie attendue)
+    (50, 0, 0.5, True, 80, "Le Monde", "Fiable"),
+    (50, 0, 0.5, True, 60, "AFP Factuel", "Plutôt fiable"),
+    (50, 0, 0.5, True, 30, "Reuters", "Fake News"),
+    (50, 0, 0.5, True, 31, "BBC", "Douteux"),
+    (90, 1, 0.8, False, 50, "", "Fake News"),
+    (50, 1, 0.8, False, 50, "", "Fake News"),
+    (50, 1, 0.6, False, 50, "", "Douteux"),
+    (29, 1, 0.6, False, 50, "", "Peu fiable"),
+    (60, 0, 0.9, False, 50, "", "Fiable"),
+    (59.99, 0, 0.9, False, 50, "", "Plutôt fiable"),
+    (40, 0, 0.9, False, 50, "", "Plutôt fiable"),
+    (25, 0, 0.9, False, 50, "", "Douteux"),
+    (24.99, 0, 0.9, False, 50, "", "Peu fiable"),
+    (70, 2, 0.9, False, 50, "", "Fiable"),
+    (50, 2, 0.9, False, 50, "", "Plutôt fiable"),
+    (40, 2, 0.9, False, 50, "", "Douteux"),
+    (20, 2, 0.9, False, 50, "", "Peu fiable"),
+    (19.99, 2, 0.9, False, 50, "", "Non fiable"),
+    # Source moyennement fiable : pas de priorité au fact-check
+    (50, 0, 0.5, True, 90, "Figaro", "Plutôt fiable"),
+]
+
+CONFIDENCE_LEVEL_CASES = [
+    # (confiance contenu, confiance fake, fact-check, niveau attendu)
+    (0.9, 0.9, True, "Très élevée"),
+    (0.8, 0.8, True, "Élevée"),
+    (0.9, 0.9, False, "Élevée"),
+    (0.7, 0.7, False, "Moyenne"),
+    (0.5, 0.5, False, "Faible"),
+]
+
+@pytest.mark.parametrize("category, fake_confidence, content_confidence, expected", CONTENT_SCORE_CASES)
+def test_content_reliability_score_thresholds(category, fake_confidence, content_confidence, expected):
+    assert calculate_content_reliability_score(category, fake_confidence, content_confidence) == pytest.approx(expected)
+    vectorized = content_reliability_scores([category], [fake_confidence], [content_confidence])
+    assert vectorized[0] == pytest.approx(expected)
+
+@pytest.mark.parametrize("global_score, is_fake, fake_confidence, has_fact_check, external_score, source, expected", FINAL_CATEGORY_CASES)
+def test_final_category_thresholds(global_score, is_fake, fake_confidence, has_fact_check, external_score, source, expected):
+    assert determine_final_category(global_score, is_fake, fake_confidence, has_fact_check, external_score, source) == expected
+    vectorized = final_categories([global_score], [is_fake], [fake_confidence], [has_fact_check], [external_score], [source])
+    assert vectorized[0] == expected
+
+@pytest.mark.parametrize("content_confidence, fake_confidence, has_fact_check, expected", CONFIDENCE_LEVEL_CASES)
+def test_confidence_level_thresholds(content_confidence, fake_confidence, has_fact_check, expected):
+    assert determine_confidence_level(content_confidence, fake_confidence, has_fact_check) == expected
+    assert confidence_levels([content_confidence], [fake_confidence], [has_fact_check])[0] == expected
+
+def test_fact_check_keywords():
+    assert rating_score("Plutôt FAUX selon nos sources") == 25
+    assert rating_score("Faux") == 5
+    assert rating_score("inconnu") == 50
+    assert calculate_external_reliability_score(None) == 50
+    assert source_trust("Le Monde - Les Décodeurs") == "high"
+    assert source_trust("Figaro, repris par Reuters") == "high"
+    assert source_trust("20 Minutes") == "medium"
+    assert source_trust("blog inconnu") is None
+
+def random_analyses(nb_rows, seed=0):
+    """Analyses tirées au hasard, avec 10 % de confiances exactement aux seuils."""
+    rng = np.random.default_rng(seed)
+    thresholds = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9]
+    ratings = list(RATING_SCORES) + ["", "inconnu", "Plutôt FAUX selon nos sources", "Vrai mais trompeur",
+                                     "C'est plus compliqué", "Faux et trompeur", "largement faux, pas vrai"]
+    sources = HIGH_TRUST_SOURCES + MEDIUM_TRUST_SOURCES + ["", "blog inconnu", "Le Monde - Les Décodeurs", "AFP Factuel",
+                                                           "Figaro, repris par Reuters"]
+
+    def confidences():
+        values = rng.random(nb_rows)
+        at_threshold = rng.random(nb_rows) < 0.1
+        values[at_threshold] = rng.choice(thresholds, at_threshold.sum())
+        return values
+
+    return pd.DataFrame({
+        "content_category": rng.choice(list(CATEGORY_SCORES) + ["Autre"], nb_rows),
+        "content_confidence": confidences(),
+        "is_fake_news": rng.choice([0, 1, 2], nb_rows, p=[0.45, 0.45, 0.1]),
+        "fake_news_confidence": confidences(),
+        "has_fact_check": rng.random(nb_rows) < 0.5,
+        "fact_check_rating": rng.choice(ratings, nb_rows),
+        "fact_check_source": rng.choice(sources, nb_rows),
+    })
+
+def test_keyword_matchers_match_naive_search():
+    frame = random_analyses(1000)
+    for rating in set(frame["fact_check_rating"]):
+        expected = next((score for key, score in RATING_SCORES.items() if key in rating.lower()), 50)
+        assert rating_score(rating) == expected, rating
+    for source in set(frame["fact_check_source"]):
+        expected = ("high" if any(trusted in source.lower() for trusted in HIGH_TRUST_SOURCES)
+                    else "medium" if any(medium in source.lower() for medium in MEDIUM_TRUST_SOURCES) else None)
+        assert source_trust(source) == expected, source
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vectorized_rules_match_scalar_rules(seed):
+    frame = random_analyses(20000, seed)
+    content_scores = content_reliability_scores(frame["content_category"], frame["fake_news_confidence"], frame["content_confidence"])
+    external_scores = external_reliability_scores(frame["fact_check_rating"], frame["has_fact_check"])
+    global_scores = global_reliability_scores(content_scores, external_scores, frame["has_fact_check"], frame["fact_check_source"])
+    categories = final_categories(global_scores, frame["is_fake_news"], frame["fake_news_confidence"],
+                                  frame["has_fact_check"], external_scores, frame["fact_check_source"])
+    levels = confidence_levels(frame["content_confidence"], frame["fake_news_confidence"], frame["has_fact_check"])
+
+    mismatches = []
+    for i, row in enumerate(frame.itertuples(index=False)):
+        fact_check_data = {"rating": row.fact_check_rating, "source": row.fact_check_source} if row.has_fact_check else None
+        content_score = calculate_content_reliability_score(row.content_category, row.fake_news_confidence, row.content_confidence)
+        external_score = calculate_external_reliability_score(fact_check_data)
+        global_score = calculate_global_reliability_score(content_score, external_score, row.has_fact_check, row.fact_check_source)
+        expected = (
+            content_score,
+            external_score,
+            global_score,
+            determine_final_category(global_score, row.is_fake_news, row.fake_news_confidence, row.has_fact_check,
+                                     external_score, row.fact_check_source),
+            determine_confidence_level(row.content_confidence, row.fake_news_confidence, row.has_fact_check),
+        )
+        actual = (content_scores[i], external_scores[i], global_scores[i], categories[i], levels[i])
+        if expected != actual:
+            mismatches.append((i, expected, actual))
+    assert not mismatches, mismatches[:5]
+
+def test_score_frame_rounds_like_score_analysis():
+    frame = random_analyses(100)
+    scores = score_frame(frame)
+    assert list(scores.index) == list(frame.index)
+    assert (scores["content_reliability_score"] == scores["content_reliability_score"].round(2)).all()
+    assert set(scores["final_category"]) <= {"Fiable", "Plutôt fiable", "Douteux", "Peu fiable", "Non fiable", "Fake News"}